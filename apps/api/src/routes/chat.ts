@@ -7,6 +7,8 @@ const router = Router();
 const chatRequestSchema = z.object({
   query: z.string().min(1, "Query cannot be empty"),
   conversationId: z.string().optional(),
+  organizationId: z.string().optional(),
+  departmentId: z.string().optional(),
 });
 
 /**
@@ -17,7 +19,7 @@ const chatRequestSchema = z.object({
 router.post("/", async (req: Request, res: Response): Promise<void> => {
   try {
     const validatedData = chatRequestSchema.parse(req.body);
-    const { query } = validatedData;
+    const { query, organizationId, departmentId } = validatedData;
 
     const vannaApiUrl = process.env.VANNA_API_BASE_URL || "http://localhost:8000";
 
@@ -29,6 +31,8 @@ router.post("/", async (req: Request, res: Response): Promise<void> => {
       },
       body: JSON.stringify({
         query,
+        organization_id: organizationId,
+        department_id: departmentId,
       }),
     });
 
@@ -0,0 +1,269 @@
+"""
+Answer Warmer
+Precomputes SQL and results for the most asked questions so one-click
+sample queries are answered instantly, and derives the sample-query
+catalog from actual usage
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from tenant_scope import TenantContext
+
+# Offered until enough real questions have been asked
+SEED_QUESTIONS = [
+    "What is the total spend in the last 90 days?",
+    "Show me top 5 vendors by spend",
+    "List all invoices from October 2025",
+    "What's the average invoice value?",
+    "Show invoices grouped by category",
+    "How many invoices are there in total?",
+    "How many invoices have APPROVED or PAID status?",
+    "List overdue invoices",
+    "What's the total spend by vendor Phunix GmbH?",
+    "Show all invoices above €1000",
+    "What are the most recent 10 invoices?",
+]
+
+# Cheap fingerprint of the data; a change triggers a full refresh
+DATA_VERSION_SQL = """
+SELECT
+    (SELECT COUNT(*) FROM invoices) AS invoice_count,
+    (SELECT MAX("updatedAt") FROM invoices) AS invoices_updated,
+    (SELECT MAX("updatedAt") FROM extracted_data) AS extracted_updated,
+    (SELECT MAX("updatedAt") FROM line_items) AS line_items_updated
+"""
+
+
+def normalize_question(question: str) -> str:
+    """Case/whitespace-insensitive form used to match repeated questions"""
+    return re.sub(r"\s+", " ", question).strip().rstrip("?.! ").lower()
+
+
+def build_catalog(usage, size: int, organization_id: str = None):
+    """Sample questions: most asked first, topped up with the seed list"""
+    questions = usage.top_questions(size, organization_id)
+    seen = {normalize_question(q) for q in questions}
+    for seed in SEED_QUESTIONS:
+        if len(questions) >= size:
+            break
+        if normalize_question(seed) not in seen:
+            questions.append(seed)
+            seen.add(normalize_question(seed))
+    return questions
+
+
+class QuestionUsage:
+    """Recent questions per tenant, persisted to a JSONL log across restarts
+
+    Like the workload log, the file rotates to "<path>.1" once it passes
+    max_bytes, so at most two bounded files are kept and read at startup.
+    """
+
+    def __init__(self, path: str, window_days: int = 30, max_bytes: int = 10 * 1024 * 1024):
+        self.path = path
+        self.window_seconds = window_days * 86400
+        self.max_bytes = max_bytes
+        self.events = []  # (asked_at, normalized question, question, org, department)
+        self.lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path:
+            return
+        cutoff = time.time() - self.window_seconds
+        for file_path in (self.path + ".1", self.path):
+            if not os.path.exists(file_path):
+                continue
+            with open(file_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        e = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if e.get("asked_at", 0) >= cutoff:
+                        self.events.append((
+                            e["asked_at"], normalize_question(e["question"]), e["question"],
+                            e.get("organization_id"), e.get("department_id"),
+                        ))
+
+    def record(self, question: str, tenant: TenantContext = None):
+        """Count a question that was answered successfully"""
+        org = tenant.organization_id if tenant else None
+        department = tenant.department_id if tenant else None
+        asked_at = time.time()
+        with self.lock:
+            self.events.append((asked_at, normalize_question(question), question, org, department))
+            if self.path:
+                try:
+                    if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                        os.replace(self.path, self.path + ".1")
+                    with open(self.path, "a", encoding="utf-8") as f:
+                        f.write(json.dumps({
+                            "question": question,
+                            "organization_id": org,
+                            "department_id": department,
+                            "asked_at": asked_at,
+                        }) + "\n")
+                except OSError as e:
+                    print(f"⚠️ Failed to write question usage log: {e}")
+
+    def _recent(self):
+        cutoff = time.time() - self.window_seconds
+        with self.lock:
+            self.events = [e for e in self.events if e[0] >= cutoff]
+            return list(self.events)
+
+    def top_questions(self, limit: int, organization_id: str = None):
+        """Most asked questions, in their latest wording, for one organization
+
+        Without an organization only unscoped questions count, so one
+        organization's questions are never offered (or warmed) for another.
+        """
+        events = [e for e in self._recent() if e[3] == organization_id]
+        counts = Counter(e[1] for e in events)
+        wording = {e[1]: e[2] for e in events}
+        return [wording[q] for q, _ in counts.most_common(limit)]
+
+    def top_tenant_questions(self, limit: int):
+        """Most asked (question, organization, department) combinations"""
+        events = self._recent()
+        counts = Counter((e[1], e[3], e[4]) for e in events)
+        wording = {(e[1], e[3], e[4]): e[2] for e in events}
+        return [(wording[key], key[1], key[2]) for key, _ in counts.most_common(limit)]
+
+
+class WarmAnswer:
+    def __init__(self, question, sql, sql_id, columns, rows):
+        self.question = question
+        self.sql = sql
+        self.sql_id = sql_id
+        self.columns = columns
+        self.rows = rows
+        self.refreshed_at = datetime.now(timezone.utc)
+
+
+class AnswerWarmer:
+    def __init__(self, worker, sql_cache, usage: QuestionUsage, catalog_size: int = 11,
+                 top_questions: int = 20, refresh_seconds: int = 900, poll_seconds: int = 60,
+                 warm_unscoped: bool = True):
+        # The worker is a dedicated VannaConfig, so warming never shares a
+        # database connection with request handling
+        self.worker = worker
+        self.sql_cache = sql_cache
+        self.usage = usage
+        self.catalog_size = catalog_size
+        self.top_questions = top_questions
+        self.refresh_seconds = refresh_seconds
+        self.poll_seconds = poll_seconds
+        self.warm_unscoped = warm_unscoped
+
+        self.answers = {}  # (tenant key, normalized question) -> WarmAnswer
+        self.lock = threading.Lock()
+        self.data_version = None
+        self.last_refresh = 0.0
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def lookup(self, question: str, tenant: TenantContext = None):
+        key = (tenant.cache_key if tenant else None, normalize_question(question))
+        with self.lock:
+            return self.answers.get(key)
+
+    def targets(self):
+        """(question, tenant) pairs worth keeping warm"""
+        targets = {}
+        if self.warm_unscoped:
+            for question in build_catalog(self.usage, self.catalog_size):
+                targets[(None, normalize_question(question))] = (question, None)
+        for question, org, department in self.usage.top_tenant_questions(self.top_questions):
+            if org is None and not self.warm_unscoped:
+                continue
+            tenant = TenantContext(org, department) if org else None
+            targets[(tenant.cache_key if tenant else None, normalize_question(question))] = (question, tenant)
+        return targets
+
+    def warm(self, question: str, tenant: TenantContext = None, sql: str = None):
+        """Compute (or recompute) one answer; existing SQL is re-run without the LLM"""
+        if sql is None:
+            sql = self.worker.scope_to_tenant(self.worker.generate_sql(question), tenant)
+        result = self.worker.run_sql(sql, read_only=tenant is not None)
+        answer = WarmAnswer(
+            question, sql,
+            self.sql_cache.add(sql, tenant.cache_key if tenant else None),
+            result.get("columns", []), result.get("rows", []),
+        )
+        with self.lock:
+            self.answers[(tenant.cache_key if tenant else None, normalize_question(question))] = answer
+        return answer
+
+    def refresh(self):
+        """Warm every target and drop answers that are no longer popular"""
+        targets = self.targets()
+        with self.lock:
+            existing = dict(self.answers)
+
+        started = time.perf_counter()
+        warmed = 0
+        for key, (question, tenant) in targets.items():
+            if self.stop_event.is_set():
+                return
+            previous = existing.get(key)
+            try:
+                self.warm(question, tenant, previous.sql if previous else None)
+                warmed += 1
+            except Exception as e:
+                print(f"⚠️ Failed to warm \"{question}\": {e}")
+
+        with self.lock:
+            for key in list(self.answers):
+                if key not in targets:
+                    del self.answers[key]
+
+        self.last_refresh = time.time()
+        print(f"🔥 Warmed {warmed}/{len(targets)} answers in {time.perf_counter() - started:.1f}s")
+
+    def current_data_version(self):
+        """Data fingerprint, or the last known one when it cannot be read"""
+        try:
+            if self.worker.db_connection is None or self.worker.db_connection.closed:
+                self.worker.connect_to_database()
+            cursor = self.worker.db_connection.cursor()
+            cursor.execute(DATA_VERSION_SQL)
+            row = cursor.fetchone()
+            cursor.close()
+            # End the transaction so the next poll sees new commits
+            self.worker.db_connection.rollback()
+            return json.dumps(row, default=str, sort_keys=True)
+        except Exception as e:
+            print(f"⚠️ Could not read data version: {e}")
+            return self.data_version
+
+    def _run(self):
+        while not self.stop_event.is_set():
+            version = self.current_data_version()
+            data_changed = version != self.data_version
+            schedule_due = time.time() - self.last_refresh >= self.refresh_seconds
+            if data_changed or schedule_due:
+                if data_changed and self.data_version is not None:
+                    print("🔄 Data changed, refreshing warm answers")
+                self.data_version = version
+                self.refresh()
+            self.stop_event.wait(self.poll_seconds)
+
+    def start(self):
+        if self.thread is None and self.worker is not None:
+            self.thread = threading.Thread(target=self._run, name="answer-warmer", daemon=True)
+            self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+        if self.worker is not None:
+            self.worker.close()
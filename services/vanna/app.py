@@ -4,9 +4,12 @@ Handles natural language queries and converts them to SQL
 """
 
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Optional, List, Dict, Any, Literal
+import itertools
 import uvicorn
 import os
 from dotenv import load_dotenv
@@ -15,7 +18,11 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Import Vanna configuration
-from vanna_config import get_vanna
+from vanna_config import VannaConfig, get_vanna
+from answer_warmer import AnswerWarmer, QuestionUsage, build_catalog
+from export_stream import EXPORT_FORMATS, ExportBusyError, export_query
+from tenant_scope import TenantContext
+from approx_query import ExactUpgrades, CONFIDENCE
 
 # Initialize FastAPI
 app = FastAPI(
@@ -33,10 +40,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject unscoped queries when every caller must identify its organization
+REQUIRE_TENANT = os.getenv("REQUIRE_TENANT", "false").lower() == "true"
+
+# Question usage drives the sample-query catalog and the answer warmer
+SAMPLE_QUERY_COUNT = int(os.getenv("SAMPLE_QUERY_COUNT", 11))
+question_usage = QuestionUsage(
+    os.getenv("QUESTION_LOG_PATH", "questions.jsonl"),
+    max_bytes=int(os.getenv("QUESTION_LOG_MAX_MB", 10)) * 1024 * 1024
+)
+warmer = None
+
+# Exact re-runs of approximate answers, on their own connection
+exact_upgrades = ExactUpgrades(lambda: VannaConfig(record_workload=False))
+
 # Request/Response Models
-class QueryRequest(BaseModel):
+class TenantScopedRequest(BaseModel):
+    organization_id: Optional[str] = None
+    department_id: Optional[str] = None
+
+class QueryRequest(TenantScopedRequest):
     query: str
     conversation_id: Optional[str] = None
+    approx: bool = False
+    sample_percent: Optional[float] = Field(default=None, gt=0, lt=100)
+    upgrade_to_exact: bool = False
 
 class QueryResponse(BaseModel):
     query: str
@@ -45,6 +73,30 @@ class QueryResponse(BaseModel):
     explanation: Optional[str] = None
     conversation_id: Optional[str] = None
     row_count: int
+    sql_id: Optional[str] = None
+    cached: bool = False
+    refreshed_at: Optional[str] = None
+    approximate: bool = False
+    sample_fraction: Optional[float] = None
+    confidence: Optional[float] = None
+    error_bounds: Optional[Dict[str, str]] = None
+    sampled_rows: Optional[int] = None
+    exact_job_id: Optional[str] = None
+
+class ExportRequest(TenantScopedRequest):
+    query: Optional[str] = None
+    sql_id: Optional[str] = None
+    format: Literal["csv", "parquet", "xlsx"] = "csv"
+
+def get_tenant(request: TenantScopedRequest) -> Optional[TenantContext]:
+    """Build the tenant context for a request, enforcing REQUIRE_TENANT"""
+    if request.organization_id:
+        return TenantContext(request.organization_id, request.department_id)
+    if request.department_id:
+        raise HTTPException(status_code=400, detail="department_id requires organization_id")
+    if REQUIRE_TENANT:
+        raise HTTPException(status_code=400, detail="organization_id is required")
+    return None
 
 @app.on_event("startup")
 async def startup_event():
@@ -60,6 +112,34 @@ async def startup_event():
     except Exception as e:
         print(f"❌ Vanna initialization failed: {e}")
         print("⚠️  Service will still respond but may have limited functionality")
+        return
+    
+    if os.getenv("WARMER_ENABLED", "true").lower() == "true":
+        global warmer
+        try:
+            # Background workers stay out of the workload log, so the index
+            # advisor only sees (and counts) queries users actually ran
+            warmer = AnswerWarmer(
+                VannaConfig(record_workload=False),
+                vanna.sql_cache,
+                question_usage,
+                catalog_size=SAMPLE_QUERY_COUNT,
+                top_questions=int(os.getenv("WARMER_TOP_QUESTIONS", 20)),
+                refresh_seconds=int(os.getenv("WARMER_REFRESH_SECONDS", 900)),
+                poll_seconds=int(os.getenv("WARMER_POLL_SECONDS", 60)),
+                warm_unscoped=not REQUIRE_TENANT
+            )
+            warmer.start()
+            print("🔥 Answer warmer started")
+        except Exception as e:
+            print(f"⚠️ Answer warmer disabled: {e}")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background warming"""
+    if warmer is not None:
+        warmer.stop()
+    exact_upgrades.shutdown()
 
 @app.get("/")
 async def root():
@@ -90,41 +170,115 @@ async def process_query(request: QueryRequest):
     - "List all overdue invoices"
     - "What's the average invoice value by category?"
     """
+    tenant = get_tenant(request)
+    
+    # Serve precomputed answers instantly
+    warm = warmer.lookup(request.query, tenant) if warmer else None
+    if warm is not None:
+        question_usage.record(request.query, tenant)
+        return QueryResponse(
+            query=request.query,
+            sql=warm.sql,
+            results=warm.rows,
+            explanation=f"Found {len(warm.rows)} results",
+            conversation_id=request.conversation_id,
+            row_count=len(warm.rows),
+            sql_id=warm.sql_id,
+            cached=True,
+            refreshed_at=warm.refreshed_at.isoformat()
+        )
+    
     try:
         # Get Vanna instance
         vanna = get_vanna()
         
         # Process query
-        result = vanna.ask(request.query)
+        result = vanna.ask(request.query, tenant, approx=request.approx, sample_percent=request.sample_percent)
+        if result.get('error'):
+            raise HTTPException(status_code=500, detail=f"Query processing failed: {result['error']}")
+        
+        # Only answered questions feed the sample-query catalog and the warmer
+        question_usage.record(request.query, tenant)
         
         # Generate explanation
         explanation = f"Found {result['row_count']} results"
         
+        approx = result.get('approx')
+        if approx is None:
+            # sampled_rows is set when a sample was too small (or empty) and
+            # the exact query answered instead
+            if result.get('sampled_rows') is not None:
+                explanation += f" (sample held only {result['sampled_rows']} rows, exact answer returned)"
+            return QueryResponse(
+                query=request.query,
+                sql=result['sql'],
+                results=result['results'],
+                explanation=explanation,
+                conversation_id=request.conversation_id,
+                row_count=result['row_count'],
+                sql_id=result.get('sql_id'),
+                sampled_rows=result.get('sampled_rows')
+            )
+        
+        exact_job_id = None
+        if request.upgrade_to_exact:
+            exact_job_id = exact_upgrades.submit(result['exact_sql'], tenant.cache_key if tenant else None)
+        
         return QueryResponse(
             query=request.query,
             sql=result['sql'],
             results=result['results'],
-            explanation=explanation,
+            explanation=f"{explanation} (estimated from a {approx.sample_percent:g}% sample)",
             conversation_id=request.conversation_id,
-            row_count=result['row_count']
+            row_count=result['row_count'],
+            sql_id=result.get('sql_id'),
+            approximate=True,
+            sample_fraction=approx.sample_fraction,
+            confidence=CONFIDENCE,
+            error_bounds=approx.margins,
+            sampled_rows=result['sampled_rows'],
+            exact_job_id=exact_job_id
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Query processing failed: {str(e)}"
         )
 
+@app.get("/api/query/exact/{job_id}")
+async def get_exact_result(job_id: str, organization_id: Optional[str] = None, department_id: Optional[str] = None):
+    """Poll the exact result that replaces an approximate answer"""
+    tenant = get_tenant(TenantScopedRequest(organization_id=organization_id, department_id=department_id))
+    job = exact_upgrades.get(job_id, tenant.cache_key if tenant else None)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired job: {job_id}")
+    
+    result = job["result"] or {}
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "error": job["error"],
+        "results": result.get("rows", []),
+        "row_count": result.get("row_count", 0),
+        "seconds": round(job["finished_at"] - job["submitted_at"], 3) if job["finished_at"] else None
+    }
+
 @app.post("/api/generate-sql")
 async def generate_sql_only(request: QueryRequest):
     """Generate SQL without executing it"""
+    tenant = get_tenant(request)
+    
     try:
         vanna = get_vanna()
-        sql = vanna.generate_sql(request.query)
+        sql = vanna.scope_to_tenant(vanna.generate_sql(request.query), tenant)
         
         return {
             "query": request.query,
-            "sql": sql
+            "sql": sql,
+            "sql_id": vanna.sql_cache.add(sql, tenant.cache_key if tenant else None)
         }
     except Exception as e:
         raise HTTPException(
@@ -132,23 +286,71 @@ async def generate_sql_only(request: QueryRequest):
             detail=f"SQL generation failed: {str(e)}"
         )
 
+@app.post("/api/query/export")
+async def export_query_results(request: ExportRequest):
+    """
+    Stream the full result of a question (or previously generated SQL) as a file
+    
+    Rows are read from a server-side cursor in batches and written straight
+    into CSV, Parquet or XLSX, so exports of millions of rows use flat memory.
+    """
+    tenant = get_tenant(request)
+    vanna = get_vanna()
+    
+    if request.sql_id:
+        sql = vanna.sql_cache.get(request.sql_id, tenant.cache_key if tenant else None)
+        if sql is None:
+            raise HTTPException(status_code=404, detail=f"Unknown or expired sql_id: {request.sql_id}")
+    elif request.query:
+        try:
+            sql = await run_in_threadpool(vanna.generate_sql, request.query)
+            sql = vanna.scope_to_tenant(sql, tenant)
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"SQL generation failed: {str(e)}"
+            )
+    else:
+        raise HTTPException(status_code=400, detail="Either query or sql_id is required")
+    
+    media_type, extension = EXPORT_FORMATS[request.format]
+    chunks = export_query(vanna.database_url, sql, request.format)
+    
+    # Pull the first chunk before responding so SQL errors still return a 500
+    try:
+        first = await run_in_threadpool(next, chunks, b"")
+    except ExportBusyError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Export failed: {str(e)}"
+        )
+    
+    return StreamingResponse(
+        itertools.chain([first], chunks),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="query-results.{extension}"'}
+    )
+
+@app.get("/api/prepared-statements/stats")
+async def get_prepared_statement_stats():
+    """Report prepared statement reuse and estimated parse/plan time saved"""
+    try:
+        vanna = get_vanna()
+        return vanna.statement_cache.stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to read prepared statement stats: {str(e)}"
+        )
+
 @app.get("/api/sample-queries")
-async def get_sample_queries():
-    """Return sample queries users can try"""
+async def get_sample_queries(organization_id: Optional[str] = None, department_id: Optional[str] = None):
+    """Return sample queries users can try, most asked first within the caller's organization"""
+    tenant = get_tenant(TenantScopedRequest(organization_id=organization_id, department_id=department_id))
     return {
-        "queries": [
-            "What is the total spend in the last 90 days?",
-            "Show me top 5 vendors by spend",
-            "List all invoices from October 2025",
-            "What's the average invoice value?",
-            "Show invoices grouped by category",
-            "How many invoices are there in total?",
-            "How many invoices have APPROVED or PAID status?",
-            "List overdue invoices",
-            "What's the total spend by vendor Phunix GmbH?",
-            "Show all invoices above €1000",
-            "What are the most recent 10 invoices?"
-        ]
+        "queries": build_catalog(question_usage, SAMPLE_QUERY_COUNT, tenant.organization_id if tenant else None)
     }
 
 if __name__ == "__main__":
@@ -0,0 +1,253 @@
+"""
+Approximate Answers
+Rewrites eligible aggregate SQL to read a TABLESAMPLE SYSTEM sample of the
+fact table, scaling SUM/COUNT estimates and adding 95% error margins, and
+runs the exact query in the background on request
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from sql_params import tokenize, join_tokens
+from tenant_scope import NON_ALIAS_KEYWORDS
+
+# Large fact tables worth sampling
+SAMPLEABLE_TABLES = {"extracted_data", "line_items"}
+ESTIMABLE_AGGREGATES = {"sum", "count", "avg"}
+
+# Constructs whose result cannot be estimated from a sample
+INELIGIBLE_KEYWORDS = {
+    "distinct", "having", "over", "union", "intersect", "except", "with",
+    "tablesample", "min", "max", "lateral",
+}
+
+CONFIDENCE = 0.95
+Z_95 = 1.96  # two-sided z-score for CONFIDENCE
+MIN_SAMPLE_PERCENT = 0.1
+
+# Fewer sampled rows than this and the exact query is run instead
+MIN_SAMPLED_ROWS = 1000
+SAMPLED_ROWS_COLUMN = "sampled_rows"
+
+
+class ApproxRewrite:
+    def __init__(self, sql: str, table: str, sample_percent: float, margins: dict):
+        self.sql = sql
+        self.table = table
+        self.sample_percent = sample_percent
+        self.margins = margins  # estimate column -> margin column
+
+    @property
+    def sample_fraction(self) -> float:
+        return self.sample_percent / 100
+
+
+def choose_sample_percent(estimated_rows: float, target_rows: int) -> float:
+    """Percentage of the table that yields roughly target_rows sampled rows"""
+    if not estimated_rows or estimated_rows <= target_rows:
+        return 100.0
+    return round(max(target_rows / estimated_rows * 100, MIN_SAMPLE_PERCENT), 3)
+
+
+def _split_items(tokens):
+    """Split a token list on top-level commas"""
+    items, current, depth = [], [], 0
+    for token in tokens:
+        if token[1] == "(":
+            depth += 1
+        elif token[1] == ")":
+            depth -= 1
+        if token[1] == "," and depth == 0:
+            items.append(current)
+            current = []
+        else:
+            current.append(token)
+    if current:
+        items.append(current)
+    return items
+
+
+def _column_name(token):
+    kind, text = token
+    return text[1:-1] if kind == "ident" else text.lower()
+
+
+def sampled_table(sql: str):
+    """The fact table an aggregate query would be sampled on, or None if ineligible"""
+    tokens = [t for t in tokenize(sql) if t[0] not in ("space", "comment")]
+    words = [text.lower() for kind, text in tokens if kind == "word"]
+    if not words or words[0] != "select" or words.count("select") > 1:
+        return None
+    if INELIGIBLE_KEYWORDS & set(words):
+        return None
+    if not any(
+        tokens[i][1].lower() in ESTIMABLE_AGGREGATES and tokens[i + 1][1] == "("
+        for i in range(len(tokens) - 1)
+    ):
+        return None
+
+    from_at = next((i for i, t in enumerate(tokens) if t[1].lower() == "from"), None)
+    if from_at is None or from_at + 1 >= len(tokens):
+        return None
+    table = _column_name(tokens[from_at + 1])
+    return table if table in SAMPLEABLE_TABLES else None
+
+
+def _estimate(function: str, arg: str, alias: str, f: float):
+    """(estimate sql, margin sql) for one aggregate over a sample fraction f"""
+    margin_alias = f'"{alias}_margin"'
+    if function == "sum":
+        return (
+            f'SUM({arg}) / {f} AS "{alias}"',
+            f"{Z_95} * SQRT((1 - {f}) * SUM(({arg}) * ({arg}))) / {f} AS {margin_alias}",
+        )
+    if function == "count":
+        return (
+            f'ROUND(COUNT({arg}) / {f}) AS "{alias}"',
+            f"{Z_95} * SQRT((1 - {f}) * COUNT({arg})) / {f} AS {margin_alias}",
+        )
+    return (
+        f'AVG({arg}) AS "{alias}"',
+        f"{Z_95} * COALESCE(STDDEV_SAMP({arg}), 0) * SQRT(1 - {f}) / SQRT(GREATEST(COUNT({arg}), 1)) AS {margin_alias}",
+    )
+
+
+def rewrite_approx(sql: str, sample_percent: float):
+    """
+    Rewrite an aggregate query to run on a TABLESAMPLE SYSTEM sample
+
+    Every select item must either be a plain grouping expression or a bare
+    SUM/COUNT/AVG call (optionally aliased). SUM and COUNT are scaled up by
+    the sample fraction; each aggregate gets a "<column>_margin" column with
+    its 95% margin of error, and a final "sampled_rows" column counts the
+    rows the estimate rests on. These are appended at the end so positional
+    GROUP BY / ORDER BY references keep working. SYSTEM sampling picks whole
+    pages, so the margins assume rows are not clustered by the measured values.
+
+    Returns an ApproxRewrite, or None when the query is not eligible.
+    """
+    table = sampled_table(sql)
+    if table is None:
+        return None
+
+    tokens = [t for t in tokenize(sql) if t[0] not in ("space", "comment")]
+    from_at = next(i for i, t in enumerate(tokens) if t[1].lower() == "from")
+    f = sample_percent / 100
+
+    items = []
+    margin_items = []
+    margins = {}
+    aliases = {SAMPLED_ROWS_COLUMN}
+    for item in _split_items(tokens[1:from_at]):
+        function = item[0][1].lower()
+        bare_aggregate = function in ESTIMABLE_AGGREGATES and len(item) > 2 and item[1][1] == "("
+        if not bare_aggregate:
+            if any(t[1].lower() in ESTIMABLE_AGGREGATES for t in item):
+                return None  # aggregate inside an expression
+            items.append(join_tokens([t[1] for t in item]))
+            continue
+
+        depth, close = 0, None
+        for j in range(1, len(item)):
+            if item[j][1] == "(":
+                depth += 1
+            elif item[j][1] == ")":
+                depth -= 1
+                if depth == 0:
+                    close = j
+                    break
+        rest = item[close + 1:]
+        if rest and rest[0][1].lower() == "as":
+            rest = rest[1:]
+        if len(rest) > 1:
+            return None
+        alias = _column_name(rest[0]) if rest else function
+        # Unaliased SUM(a), SUM(b) would both be "sum"
+        base, n = alias, 1
+        while alias in aliases or f"{alias}_margin" in aliases:
+            n += 1
+            alias = f"{base}_{n}"
+        aliases.update((alias, f"{alias}_margin"))
+
+        arg = join_tokens([t[1] for t in item[2:close]])
+        estimate, margin = _estimate(function, arg, alias, f)
+        items.append(estimate)
+        margin_items.append(margin)
+        margins[alias] = f"{alias}_margin"
+
+    # TABLESAMPLE goes after the table and its alias
+    after_table = from_at + 2
+    if after_table < len(tokens) and tokens[after_table][1].lower() == "as":
+        after_table += 2
+    elif after_table < len(tokens) and tokens[after_table][0] in ("word", "ident") \
+            and tokens[after_table][1].lower() not in NON_ALIAS_KEYWORDS:
+        after_table += 1
+
+    sample = f"TABLESAMPLE SYSTEM ({sample_percent})"
+    rewritten = (
+        "SELECT " + ", ".join(items + margin_items + [f'COUNT(*) AS "{SAMPLED_ROWS_COLUMN}"'])
+        + " " + join_tokens([t[1] for t in tokens[from_at:after_table]])
+        + " " + sample
+        + (" " + join_tokens([t[1] for t in tokens[after_table:]]) if after_table < len(tokens) else "")
+    )
+    return ApproxRewrite(rewritten, table, sample_percent, margins)
+
+
+class ExactUpgrades:
+    """Runs exact versions of approximate queries in the background"""
+
+    def __init__(self, worker_factory, max_jobs: int = 200):
+        # One worker with its own database connection, used only by the executor thread
+        self.worker_factory = worker_factory
+        self.worker = None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="exact-upgrade")
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()  # job id -> job dict
+        self.lock = threading.Lock()
+
+    def submit(self, sql: str, tenant_key: str = None) -> str:
+        job_id = uuid.uuid4().hex
+        with self.lock:
+            self.jobs[job_id] = {
+                "status": "pending",
+                "tenant_key": tenant_key,
+                "result": None,
+                "error": None,
+                "submitted_at": time.time(),
+                "finished_at": None,
+            }
+            while len(self.jobs) > self.max_jobs:
+                self.jobs.popitem(last=False)
+        self.executor.submit(self._run, job_id, sql, tenant_key is not None)
+        return job_id
+
+    def _run(self, job_id: str, sql: str, read_only: bool = False):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job["status"] = "running"
+        try:
+            if self.worker is None:
+                self.worker = self.worker_factory()
+            result = self.worker.run_sql(sql, read_only=read_only)
+            job.update(status="done", result=result)
+        except Exception as e:
+            job.update(status="failed", error=str(e))
+        job["finished_at"] = time.time()
+
+    def get(self, job_id: str, tenant_key: str = None):
+        """Job state, or None when unknown or owned by another tenant"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None or job["tenant_key"] != tenant_key:
+                return None
+            return dict(job)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        if self.worker is not None:
+            self.worker.close()
@@ -0,0 +1,298 @@
+"""
+Query Result Export
+Streams SQL results from a server-side cursor into CSV, Parquet or XLSX
+in fixed-size batches, so memory stays flat regardless of result size
+
+Benchmark:
+    python export_stream.py --sql "SELECT * FROM line_items" --format parquet
+"""
+
+import csv
+import io
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+import psycopg2
+import psycopg2.extensions
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx"),
+}
+
+DEFAULT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 10000))
+
+# Each running export holds its own database connection
+MAX_CONCURRENT_EXPORTS = int(os.getenv("EXPORT_MAX_CONCURRENT", 4))
+export_slots = threading.BoundedSemaphore(MAX_CONCURRENT_EXPORTS)
+
+# Rows per worksheet Excel can open (header included)
+XLSX_MAX_ROWS = 1048576
+
+# Postgres type OIDs -> pyarrow type names
+ARROW_TYPES = {
+    16: "bool",
+    20: "int64", 21: "int64", 23: "int64",
+    700: "float64", 701: "float64", 1700: "float64",
+    1082: "date32",
+    1114: "timestamp",
+    1184: "timestamptz",
+}
+
+# Read NUMERIC straight into float instead of building Decimal objects
+NUMERIC_AS_FLOAT = psycopg2.extensions.new_type(
+    psycopg2.extensions.DECIMAL.values,
+    "NUMERIC_AS_FLOAT",
+    lambda value, cursor: float(value) if value is not None else None
+)
+
+
+class ExportBusyError(RuntimeError):
+    """Raised when MAX_CONCURRENT_EXPORTS exports are already running"""
+
+
+class ExportStats:
+    def __init__(self, format: str):
+        self.format = format
+        self.rows = 0
+        self.bytes = 0
+        self.started_at = time.perf_counter()
+
+    def summary(self) -> dict:
+        elapsed = time.perf_counter() - self.started_at
+        return {
+            "format": self.format,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(self.rows / elapsed) if elapsed else 0,
+            "mb_per_second": round(self.bytes / 1048576 / elapsed, 2) if elapsed else 0,
+        }
+
+
+def open_export_connection(database_url: str):
+    """Dedicated connection for one export, so long streams never block chat queries"""
+    connection = psycopg2.connect(database_url)
+    connection.set_session(readonly=True)
+    psycopg2.extensions.register_type(NUMERIC_AS_FLOAT, connection)
+    return connection
+
+
+def _batches(connection, sql: str, batch_size: int):
+    """Yield (columns, rows) batches of plain tuples from a named server-side cursor"""
+    cursor = connection.cursor(name=f"export_{uuid.uuid4().hex[:12]}")
+    cursor.itersize = batch_size
+    try:
+        cursor.execute(sql.strip().rstrip(";"))
+        rows = cursor.fetchmany(batch_size)
+        columns = [desc[0] for desc in cursor.description]
+        type_codes = [desc[1] for desc in cursor.description]
+        yield columns, type_codes, rows
+        while rows:
+            rows = cursor.fetchmany(batch_size)
+            if rows:
+                yield columns, type_codes, rows
+    finally:
+        cursor.close()
+
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    return data
+
+
+class ChunkSink:
+    """Write-only file object that hands written bytes back in chunks
+
+    Unlike draining a BytesIO, tell() keeps counting from the start of the
+    stream, which the Parquet writer relies on for its footer offsets.
+    """
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return False
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def stream_csv(connection, sql: str, stats: ExportStats, batch_size: int = DEFAULT_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    header_written = False
+    for columns, _, rows in _batches(connection, sql, batch_size):
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        writer.writerows(rows)
+        stats.rows += len(rows)
+        chunk = _drain(buffer).encode("utf-8")
+        stats.bytes += len(chunk)
+        yield chunk
+
+
+def _arrow_schema(pa, columns, type_codes):
+    fields = []
+    for name, oid in zip(columns, type_codes):
+        arrow_type = ARROW_TYPES.get(oid, "string")
+        if arrow_type == "timestamp":
+            field_type = pa.timestamp("us")
+        elif arrow_type == "timestamptz":
+            field_type = pa.timestamp("us", tz="UTC")
+        else:
+            field_type = getattr(pa, arrow_type)()
+        fields.append(pa.field(name, field_type))
+    return pa.schema(fields)
+
+
+def stream_parquet(connection, sql: str, stats: ExportStats, batch_size: int = DEFAULT_BATCH_SIZE):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = ChunkSink()
+    writer = None
+    schema = None
+    try:
+        for columns, type_codes, rows in _batches(connection, sql, batch_size):
+            if writer is None:
+                schema = _arrow_schema(pa, columns, type_codes)
+                writer = pq.ParquetWriter(sink, schema, compression="snappy")
+            if not rows:
+                continue
+
+            # Column-wise arrays straight from the row tuples, no per-row dicts
+            arrays = []
+            for field, values in zip(schema, zip(*rows)):
+                if pa.types.is_string(field.type):
+                    values = [None if v is None else str(v) for v in values]
+                arrays.append(pa.array(values, type=field.type))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+
+            stats.rows += len(rows)
+            chunk = sink.drain()
+            stats.bytes += len(chunk)
+            yield chunk
+    finally:
+        if writer is not None:
+            writer.close()
+
+    chunk = sink.drain()
+    stats.bytes += len(chunk)
+    yield chunk
+
+
+def stream_xlsx(connection, sql: str, stats: ExportStats, batch_size: int = DEFAULT_BATCH_SIZE):
+    # XLSX is a zip archive that can only be emitted once complete, so rows are
+    # written with openpyxl's write-only mode into a temp file spooled to disk.
+    # Results longer than one worksheet continue on "Results 2", "Results 3", ...
+    import tempfile
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = None
+    sheet_rows = 0
+    for columns, _, rows in _batches(connection, sql, batch_size):
+        if sheet is None:
+            sheet = workbook.create_sheet("Results")
+            sheet.append(columns)
+            sheet_rows = 1
+        for row in rows:
+            if sheet_rows >= XLSX_MAX_ROWS:
+                sheet = workbook.create_sheet(f"Results {len(workbook.worksheets) + 1}")
+                sheet.append(columns)
+                sheet_rows = 1
+            # Excel has no timezone support, keep tz-aware timestamps as text
+            sheet.append([v.isoformat() if isinstance(v, datetime) and v.tzinfo else v for v in row])
+            sheet_rows += 1
+        stats.rows += len(rows)
+
+    with tempfile.SpooledTemporaryFile(max_size=8 * 1048576) as f:
+        workbook.save(f)
+        f.seek(0)
+        while True:
+            chunk = f.read(1048576)
+            if not chunk:
+                break
+            stats.bytes += len(chunk)
+            yield chunk
+
+
+STREAMERS = {
+    "csv": stream_csv,
+    "parquet": stream_parquet,
+    "xlsx": stream_xlsx,
+}
+
+
+def export_query(database_url: str, sql: str, format: str, batch_size: int = DEFAULT_BATCH_SIZE):
+    """Generator of encoded file chunks; owns (and always closes) its connection
+
+    Raises ExportBusyError on the first chunk when every export slot is taken.
+    """
+    if not export_slots.acquire(blocking=False):
+        raise ExportBusyError(f"{MAX_CONCURRENT_EXPORTS} exports already running, try again shortly")
+    try:
+        stats = ExportStats(format)
+        connection = open_export_connection(database_url)
+        try:
+            yield from STREAMERS[format](connection, sql, stats, batch_size)
+            print(f"✅ Export finished: {stats.summary()}")
+        finally:
+            connection.close()
+    finally:
+        export_slots.release()
+
+
+if __name__ == "__main__":
+    import argparse
+    import resource
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(description="Measure export throughput and memory")
+    parser.add_argument("--sql", required=True)
+    parser.add_argument("--format", choices=sorted(STREAMERS), default="csv")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    stats = ExportStats(args.format)
+    connection = open_export_connection(os.getenv("DATABASE_URL"))
+    try:
+        for _ in STREAMERS[args.format](connection, args.sql, stats, args.batch_size):
+            pass
+    finally:
+        connection.close()
+
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"📦 {stats.summary()} | peak RSS {peak_mb:.1f} MB")
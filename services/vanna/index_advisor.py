@@ -0,0 +1,568 @@
+"""
+Index Advisor
+Offline command that reads the recorded generated-SQL workload and proposes
+covering, expression and partial indexes ranked by estimated time saved
+
+Usage:
+    python index_advisor.py                   # dry run: print proposals only
+    python index_advisor.py --top 5           # limit to the 5 best proposals
+    python index_advisor.py --apply --top 3   # create the 3 best proposals
+"""
+
+import argparse
+import os
+import re
+from collections import defaultdict
+
+from dotenv import load_dotenv
+
+from sql_params import tokenize, join_tokens
+from workload import load_workload, param_digest
+
+load_dotenv()
+
+# Tables the LLM is allowed to query, with their columns
+TABLE_COLUMNS = {
+    "extracted_data": {
+        "id", "invoiceId", "vendorName", "vendorAddress", "invoiceNumber", "invoiceDate",
+        "dueDate", "subtotal", "taxAmount", "totalAmount", "currency", "category",
+        "createdAt", "updatedAt",
+    },
+    "invoices": {
+        "id", "name", "status", "organizationId", "departmentId", "processedAt",
+        "createdAt", "updatedAt",
+    },
+    "line_items": {
+        "id", "invoiceId", "description", "quantity", "unitPrice", "amount", "category",
+        "createdAt", "updatedAt",
+    },
+}
+
+# Indexes declared in the Prisma schema (primary keys and unique columns included)
+KNOWN_INDEXES = {
+    "extracted_data": [("id",), ("invoiceId",), ("vendorName",), ("invoiceNumber",), ("invoiceDate",), ("category",)],
+    "invoices": [("id",), ("organizationId",), ("departmentId",), ("status",), ("createdAt",)],
+    "line_items": [("id",), ("invoiceId",)],
+}
+
+COMPARISON_OPS = {"=", "<", ">", "<=", ">=", "in", "between"}
+RANGE_OPS = {"<", ">", "<=", ">=", "between"}
+INDEXABLE_FUNCTIONS = {"extract", "date_trunc"}
+CLAUSE_KEYWORDS = {
+    "where", "join", "inner", "left", "right", "full", "cross", "on", "group", "order",
+    "limit", "offset", "having", "union", "using", "natural", "as", "tablesample",
+}
+
+# Never used as a partial index predicate: tenant and row identifiers would
+# bake one organization's (or row's) value into a shared index
+PARTIAL_EXCLUDED_COLUMNS = {"id", "invoiceId", "organizationId", "departmentId", "vendorName"}
+
+# A value must be seen this many times before it counts as constant
+MIN_CONSTANT_EXECUTIONS = 5
+DISTINCT_VALUE_LIMIT = 1000
+
+# How much of a sequential scan a proposal is expected to remove, by usage
+USAGE_WEIGHTS = {"filter": 1.0, "join": 0.5, "group": 0.3}
+DEFAULT_SCAN_SHARE = 0.5  # used when no plan was captured
+
+
+class StatementShape:
+    """Tables, predicates and expressions referenced by one normalized statement"""
+
+    def __init__(self, statement: str):
+        self.tokens = [t for t in tokenize(statement) if t[0] not in ("space", "comment")]
+        self.aliases = {}
+        self.tables = []
+        self.filters = []      # (table, column, kind, placeholder or literal)
+        self.joins = []        # (table, column)
+        self.expressions = []  # (table, expression sql, usage)
+        self.selected = defaultdict(list)
+        self.select_star = False
+
+        self._find_tables()
+        self._find_selected()
+        self._find_predicates()
+
+    def _text(self, i):
+        return self.tokens[i][1].lower() if 0 <= i < len(self.tokens) else None
+
+    def _wrapped_table(self, open_at):
+        """Table behind a (SELECT * | SELECT x.* FROM table ...) subquery, such
+        as the tenant-scoping rewrite, or None for any other subquery"""
+        select_at = open_at + 1
+        star_at = select_at + 1
+        if self._text(select_at) != "select":
+            return None
+        if self._text(star_at + 1) == ".":
+            star_at += 2
+        if self._text(star_at) != "*" or self._text(star_at + 1) != "from":
+            return None
+        table = self._text(star_at + 2)
+        return table if table in TABLE_COLUMNS else None
+
+    def _find_tables(self):
+        for i, (kind, text) in enumerate(self.tokens):
+            if text.lower() not in ("from", "join"):
+                continue
+            table = self._text(i + 1)
+            alias_at = i + 2
+            if table == "(":
+                # The alias of a wrapping subquery stands for the table inside
+                table = self._wrapped_table(i + 1)
+                close = self._matching_close(i + 1)
+                if table is None or close is None:
+                    continue
+                alias_at = close + 1
+            elif table not in TABLE_COLUMNS:
+                continue
+            self.tables.append(table)
+            self.aliases[table] = table
+            if self._text(alias_at) == "as":
+                alias_at += 1
+            alias = self._text(alias_at)
+            if alias and self.tokens[alias_at][0] == "word" and alias not in CLAUSE_KEYWORDS:
+                self.aliases[alias] = table
+
+    def _column_at(self, end):
+        """Resolve a column reference ending at token index end -> (table, column, start)"""
+        if end < 0:
+            return None
+        kind, text = self.tokens[end]
+        if kind == "ident":
+            column = text[1:-1]
+        elif kind == "word" and not re.fullmatch(r"\$\d+", text):
+            column = text
+        else:
+            return None
+
+        if end >= 2 and self._text(end - 1) == ".":
+            table = self.aliases.get(self._text(end - 2))
+            if table and column in TABLE_COLUMNS[table]:
+                return table, column, end - 2
+            return None
+
+        owners = [t for t in dict.fromkeys(self.tables) if column in TABLE_COLUMNS[t]]
+        if len(owners) == 1:
+            return owners[0], column, end
+        return None
+
+    def _matching_open(self, close):
+        depth = 0
+        for i in range(close, -1, -1):
+            if self.tokens[i][1] == ")":
+                depth += 1
+            elif self.tokens[i][1] == "(":
+                depth -= 1
+                if depth == 0:
+                    return i
+        return None
+
+    def _matching_close(self, open_at):
+        depth = 0
+        for i in range(open_at, len(self.tokens)):
+            if self.tokens[i][1] == "(":
+                depth += 1
+            elif self.tokens[i][1] == ")":
+                depth -= 1
+                if depth == 0:
+                    return i
+        return None
+
+    def _expression(self, start, end):
+        """Rebuild a function call without table aliases, ready for CREATE INDEX"""
+        parts = []
+        i = start
+        while i <= end:
+            text = self.tokens[i][1]
+            if self._text(i) in self.aliases and self._text(i + 1) == ".":
+                i += 2
+                continue
+            parts.append(text.upper() if self.tokens[i][0] == "word" and i == start else text)
+            i += 1
+        column = None
+        for j in range(start, end + 1):
+            ref = self._column_at(j)
+            if ref:
+                column = ref
+        return join_tokens(parts), column
+
+    def _find_selected(self):
+        if self._text(0) != "select":
+            return
+        depth = 0
+        for i in range(1, len(self.tokens)):
+            text = self._text(i)
+            if text == "(":
+                depth += 1
+            elif text == ")":
+                depth -= 1
+            elif text == "from" and depth == 0:
+                return
+            elif text == "*":
+                self.select_star = True
+            ref = self._column_at(i)
+            if ref and self._text(i + 1) != ".":
+                self.selected[ref[0]].append(ref[1])
+
+    def _find_predicates(self):
+        used_expressions = set()
+        for i, (kind, text) in enumerate(self.tokens):
+            op = text.lower()
+            if op not in COMPARISON_OPS or i == 0:
+                continue
+
+            # Left-hand side: a column or an indexable function call
+            if self.tokens[i - 1][1] == ")":
+                open_at = self._matching_open(i - 1)
+                if open_at and self._text(open_at - 1) in INDEXABLE_FUNCTIONS:
+                    expression, ref = self._expression(open_at - 1, i - 1)
+                    if ref:
+                        self.expressions.append((ref[0], expression, "filter"))
+                        used_expressions.add(open_at - 1)
+                continue
+            left = self._column_at(i - 1)
+            if not left:
+                continue
+
+            # Right-hand side: another column (join) or a value
+            right_end = i + 1
+            if right_end < len(self.tokens) and self._text(right_end + 1) == ".":
+                right_end += 2
+            right = self._column_at(right_end) if op == "=" else None
+            if right and right[2] == i + 1:
+                self.joins.append((left[0], left[1]))
+                self.joins.append((right[0], right[1]))
+                continue
+
+            value = self.tokens[i + 1][1] if i + 1 < len(self.tokens) else None
+            kind = "range" if op in RANGE_OPS else "eq"
+            self.filters.append((left[0], left[1], kind, value if op == "=" else None))
+
+        # Indexable expressions used outside predicates (SELECT / GROUP BY)
+        for i in range(len(self.tokens) - 1):
+            if self._text(i) in INDEXABLE_FUNCTIONS and self._text(i + 1) == "(" and i not in used_expressions:
+                close = self._matching_close(i + 1)
+                if close is None:
+                    continue
+                expression, ref = self._expression(i, close)
+                if ref:
+                    self.expressions.append((ref[0], expression, "group"))
+
+
+def _canonical(sql):
+    """Comparable form of an index key, expression or predicate: Postgres
+    deparses them with casts, quotes and parentheses the proposals lack"""
+    if sql is None:
+        return None
+    sql = re.sub(
+        r"::(character varying|double precision|timestamp with(out)? time zone|[a-z_]+)(\[\])?",
+        "", sql.lower()
+    )
+    return re.sub(r'[\s"()]', "", sql)
+
+
+class ExistingIndex:
+    def __init__(self, keys, include=(), where=None, name=None):
+        self.keys = tuple(_canonical(k) for k in keys)
+        self.include = tuple(_canonical(c) for c in include)
+        self.where = _canonical(where)
+        self.name = name
+
+
+class IndexProposal:
+    def __init__(self, table, keys, include=(), where=None, expression=False):
+        self.table = table
+        self.keys = tuple(keys)
+        self.include = tuple(c for c in dict.fromkeys(include) if c not in keys)
+        self.where = where
+        self.expression = expression
+        self.estimated_saved_ms = 0.0
+        self.fingerprints = set()
+
+    @property
+    def name(self):
+        slug = "_".join(re.sub(r"[^a-z0-9]+", "_", k.lower()).strip("_") for k in self.keys)
+        if self.where:
+            slug += "_where_" + re.sub(r"[^a-z0-9]+", "_", self.where.lower()).strip("_")
+        return f"idx_{self.table}_{slug}"[:63]
+
+    @property
+    def kind(self):
+        if self.expression:
+            return "expression"
+        if self.where:
+            return "partial"
+        if self.include:
+            return "covering"
+        return "btree"
+
+    def ddl(self, concurrently=True):
+        keys = ", ".join(f"({k})" if self.expression else f'"{k}"' for k in self.keys)
+        sql = f"CREATE INDEX {'CONCURRENTLY ' if concurrently else ''}IF NOT EXISTS {self.name} ON {self.table} ({keys})"
+        if self.include:
+            sql += " INCLUDE (" + ", ".join(f'"{c}"' for c in self.include) + ")"
+        if self.where:
+            sql += f" WHERE {self.where}"
+        return sql
+
+    def is_covered_by(self, existing):
+        """True when an existing index (or one created from this proposal)
+        already serves these keys, INCLUDE columns and predicate"""
+        keys = tuple(_canonical(k) for k in self.keys)
+        include = {_canonical(c) for c in self.include}
+        where = _canonical(self.where)
+        for idx in existing:
+            if idx.name == self.name:
+                return True
+            if idx.where != where or idx.keys[:len(keys)] != keys:
+                continue
+            if include <= set(idx.keys) | set(idx.include):
+                return True
+        return False
+
+
+def scan_shares(plan):
+    """Fraction of the plan's total cost spent sequentially scanning each table"""
+    if not plan:
+        return None
+    total = plan.get("Total Cost") or 0
+    shares = defaultdict(float)
+
+    def walk(node):
+        if node.get("Node Type") == "Seq Scan" and total:
+            shares[node.get("Relation Name")] += node.get("Total Cost", 0) / total
+        for child in node.get("Plans", []):
+            walk(child)
+
+    walk(plan)
+    return {table: min(share, 1.0) for table, share in shares.items()}
+
+
+def _quote_literal(value):
+    if isinstance(value, (int, float)):
+        return str(value)
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _constant_value(token, table, column, executions, resolve=None):
+    """The single value a predicate was compared with across enough executions, if any
+
+    The workload log only holds digests of bound values, so a constant
+    placeholder is turned back into a literal through resolve(table, column,
+    digest); without a resolver only literals written into the statement count.
+    """
+    if token is None or len(executions) < MIN_CONSTANT_EXECUTIONS:
+        return None
+    if token.startswith("'") or re.fullmatch(r"[\d.]+", token):
+        return token
+    match = re.fullmatch(r"\$(\d+)", token)
+    if not match or resolve is None:
+        return None
+    index = int(match.group(1)) - 1
+    digests = [e.get("param_digests", []) for e in executions]
+    if any(len(d) <= index for d in digests):
+        return None
+    values = {d[index] for d in digests}
+    if len(values) != 1:
+        return None
+    value = resolve(table, column, values.pop())
+    return _quote_literal(value) if value is not None else None
+
+
+def value_resolver(connection):
+    """resolve(table, column, digest) that finds the column value behind a digest"""
+    distinct_values = {}
+
+    def resolve(table, column, digest):
+        if column not in TABLE_COLUMNS.get(table, ()):
+            return None
+        if (table, column) not in distinct_values:
+            cursor = connection.cursor()
+            try:
+                cursor.execute(f'SELECT DISTINCT "{column}"::text FROM {table} LIMIT {DISTINCT_VALUE_LIMIT}')
+                rows = cursor.fetchall()
+                distinct_values[(table, column)] = [
+                    list(row.values())[0] if isinstance(row, dict) else row[0] for row in rows
+                ]
+            except Exception as e:
+                print(f"⚠️ Could not read values of {table}.{column}: {e}")
+                connection.rollback()
+                distinct_values[(table, column)] = []
+            finally:
+                cursor.close()
+        return next((v for v in distinct_values[(table, column)] if param_digest(v) == digest), None)
+
+    return resolve
+
+
+def propose_for_shape(shape, executions, resolve=None):
+    """Build index proposals for one statement shape, with their usage"""
+    proposals = []
+    for table in dict.fromkeys(shape.tables):
+        filters = [f for f in shape.filters if f[0] == table]
+        eq_cols = list(dict.fromkeys(f[1] for f in filters if f[2] == "eq"))
+        range_cols = list(dict.fromkeys(f[1] for f in filters if f[2] == "range"))
+        include = [] if shape.select_star else shape.selected.get(table, [])
+        if len(include) > 4:
+            include = []
+
+        # Equality on a constant value -> partial index over the remaining keys
+        partial = None
+        for _, column, kind, token in filters:
+            if kind != "eq" or column in PARTIAL_EXCLUDED_COLUMNS:
+                continue
+            constant = _constant_value(token, table, column, executions, resolve)
+            if constant is not None:
+                partial = (column, f'"{column}" = {constant}')
+                break
+
+        if partial:
+            keys = [c for c in eq_cols if c != partial[0]] + range_cols[:1]
+            if not keys:
+                keys = [c for t, c in shape.joins if t == table][:1]
+            if keys:
+                proposals.append((IndexProposal(table, keys, include, where=partial[1]), "filter"))
+                continue
+
+        keys = eq_cols + range_cols[:1]
+        if keys:
+            proposals.append((IndexProposal(table, keys, include), "filter"))
+
+        for t, column in dict.fromkeys(shape.joins):
+            if t == table and column not in keys:
+                proposals.append((IndexProposal(table, [column]), "join"))
+
+    for table, expression, usage in dict.fromkeys(shape.expressions):
+        proposals.append((IndexProposal(table, [expression], expression=True), usage))
+
+    return proposals
+
+
+def advise(entries, existing_indexes=None, resolve=None):
+    """Rank index proposals across the whole recorded workload"""
+    existing_indexes = existing_indexes or {
+        table: [ExistingIndex(keys) for keys in indexes] for table, indexes in KNOWN_INDEXES.items()
+    }
+
+    by_fingerprint = defaultdict(list)
+    for entry in entries:
+        by_fingerprint[entry["fingerprint"]].append(entry)
+
+    ranked = {}
+    for key, executions in by_fingerprint.items():
+        statement = executions[0]["statement"]
+        # The newest plan reflects the indexes that exist now
+        plan = next((e["plan"] for e in reversed(executions) if e.get("plan")), None)
+        shares = scan_shares(plan)
+        total_ms = sum(e.get("duration_ms", 0) for e in executions)
+
+        for proposal, usage in propose_for_shape(StatementShape(statement), executions, resolve):
+            if proposal.is_covered_by(existing_indexes.get(proposal.table, [])):
+                continue
+            share = DEFAULT_SCAN_SHARE if shares is None else shares.get(proposal.table, 0.0)
+            if share == 0:
+                continue  # the planner already avoids a full scan here
+
+            ddl = proposal.ddl()
+            merged = ranked.setdefault(ddl, proposal)
+            merged.estimated_saved_ms += total_ms * share * USAGE_WEIGHTS[usage]
+            merged.fingerprints.add(key)
+
+    return sorted(ranked.values(), key=lambda p: p.estimated_saved_ms, reverse=True)
+
+
+def load_existing_indexes(connection):
+    """Read every index on the advised tables, key by key, from pg_index"""
+    existing = defaultdict(list)
+    cursor = connection.cursor()
+    cursor.execute(
+        """
+        SELECT t.relname, ix.relname, i.indnkeyatts,
+               ARRAY(SELECT pg_get_indexdef(i.indexrelid, k, true)
+                     FROM generate_series(1, i.indnatts) AS k ORDER BY k),
+               pg_get_expr(i.indpred, i.indrelid, true)
+        FROM pg_index i
+        JOIN pg_class t ON t.oid = i.indrelid
+        JOIN pg_class ix ON ix.oid = i.indexrelid
+        JOIN pg_namespace n ON n.oid = t.relnamespace
+        WHERE n.nspname = 'public' AND t.relname = ANY(%s)
+        """,
+        (list(TABLE_COLUMNS),)
+    )
+    for row in cursor.fetchall():
+        table, name, key_count, columns, predicate = row.values() if isinstance(row, dict) else row
+        existing[table].append(
+            ExistingIndex(columns[:key_count], columns[key_count:], predicate, name)
+        )
+    cursor.close()
+    return existing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Propose indexes for the recorded generated-SQL workload")
+    parser.add_argument("--workload", default=os.getenv("WORKLOAD_LOG_PATH", "workload.jsonl"),
+                        help="Path to the workload log written by the service")
+    parser.add_argument("--top", type=int, default=10, help="Number of proposals to show")
+    parser.add_argument("--apply", action="store_true",
+                        help="Create the proposed indexes (CREATE INDEX CONCURRENTLY). Dry run otherwise.")
+    args = parser.parse_args()
+
+    entries = load_workload(args.workload)
+    if not entries:
+        print(f"⚠️ No workload recorded in {args.workload}")
+        return
+
+    connection = None
+    existing = None
+    resolve = None
+    database_url = os.getenv("DATABASE_URL")
+    if database_url:
+        try:
+            import psycopg2
+            connection = psycopg2.connect(database_url)
+            existing = load_existing_indexes(connection)
+            resolve = value_resolver(connection)
+        except Exception as e:
+            print(f"⚠️ Could not read existing indexes, using the Prisma schema: {e}")
+            connection = None
+
+    proposals = advise(entries, existing, resolve)[:args.top]
+    fingerprints = len({e["fingerprint"] for e in entries})
+
+    print(f"\n{'='*60}")
+    print(f"🔎 Index Advisor - {len(entries)} executions, {fingerprints} query shapes")
+    print(f"{'='*60}\n")
+
+    if not proposals:
+        print("✅ No index proposals - the workload is already served by existing indexes")
+        return
+
+    for rank, proposal in enumerate(proposals, 1):
+        print(f"{rank}. [{proposal.kind}] ~{proposal.estimated_saved_ms:.1f} ms saved "
+              f"across {len(proposal.fingerprints)} query shape(s)")
+        print(f"   {proposal.ddl()};\n")
+
+    if not args.apply:
+        print("💡 Dry run - re-run with --apply to create these indexes")
+        return
+
+    if connection is None:
+        print("❌ DATABASE_URL is required to apply indexes")
+        return
+
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    connection.rollback()
+    connection.autocommit = True
+    cursor = connection.cursor()
+    for proposal in proposals:
+        try:
+            cursor.execute(proposal.ddl())
+            print(f"✅ Created {proposal.name}")
+        except Exception as e:
+            print(f"❌ Failed to create {proposal.name}: {e}")
+    cursor.close()
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Prepared Statement Cache
+Keeps an LRU of server-side prepared statements per database connection so
+repeated SQL shapes skip Postgres parse/analyze and can reuse cached plans
+"""
+
+import time
+from collections import OrderedDict
+
+from sql_params import parameterize_sql, fingerprint
+
+# Only read queries are worth preparing
+PREPARABLE_PREFIXES = ("select", "with")
+
+
+class PreparedStatementCache:
+    def __init__(self, connection, max_size: int = 64):
+        self.connection = connection
+        self.max_size = max_size
+        self.statements = OrderedDict()  # fingerprint -> statement name
+        self.unpreparable = set()        # fingerprints Postgres refused to prepare
+
+        # Reuse / timing counters
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fallbacks = 0
+        self.prepare_ms_total = 0.0
+        self.cold_execute_ms_total = 0.0
+        self.warm_execute_ms_total = 0.0
+
+    def execute(self, cursor, sql: str):
+        """
+        Execute SQL through a prepared statement when possible
+
+        Returns the fingerprint used (or None when the SQL ran as plain text).
+        The cursor is left positioned on the result set either way.
+        """
+        statement, params = parameterize_sql(sql)
+
+        if not statement.startswith(PREPARABLE_PREFIXES) or ";" in statement:
+            cursor.execute(sql)
+            return None
+
+        key = fingerprint(statement, params)
+        if key in self.unpreparable:
+            self.fallbacks += 1
+            cursor.execute(sql)
+            return None
+
+        name = self.statements.get(key)
+        if name is not None:
+            self.statements.move_to_end(key)
+            start = time.perf_counter()
+            self._execute_prepared(cursor, name, params)
+            self.warm_execute_ms_total += (time.perf_counter() - start) * 1000
+            self.hits += 1
+            return key
+
+        name = f"fbq_{key}"
+        try:
+            start = time.perf_counter()
+            cursor.execute(f"PREPARE {name} AS {statement}")
+            prepared_at = time.perf_counter()
+            self._execute_prepared(cursor, name, params)
+            finished_at = time.perf_counter()
+        except Exception as e:
+            print(f"⚠️ Could not prepare statement {key}, running as plain SQL: {e}")
+            self.connection.rollback()
+            self._deallocate(cursor, name)
+            self.unpreparable.add(key)
+            self.fallbacks += 1
+            cursor.execute(sql)
+            return None
+
+        self.prepare_ms_total += (prepared_at - start) * 1000
+        self.cold_execute_ms_total += (finished_at - prepared_at) * 1000
+        self.misses += 1
+        self.statements[key] = name
+
+        if len(self.statements) > self.max_size:
+            _, evicted = self.statements.popitem(last=False)
+            self._deallocate(cursor, evicted)
+            self.evictions += 1
+
+        return key
+
+    def _execute_prepared(self, cursor, name: str, params: list):
+        """Run EXECUTE for a prepared statement, binding the extracted literals"""
+        if params:
+            placeholders = ", ".join(["%s"] * len(params))
+            cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    def _deallocate(self, cursor, name: str):
+        """Drop a prepared statement, ignoring ones that no longer exist"""
+        try:
+            cursor.execute(f"DEALLOCATE {name}")
+        except Exception:
+            self.connection.rollback()
+
+    def stats(self) -> dict:
+        """Reuse rate and estimated time saved by skipping re-preparation"""
+        lookups = self.hits + self.misses
+        avg_prepare_ms = self.prepare_ms_total / self.misses if self.misses else 0.0
+        avg_cold_ms = self.cold_execute_ms_total / self.misses if self.misses else 0.0
+        avg_warm_ms = self.warm_execute_ms_total / self.hits if self.hits else 0.0
+
+        return {
+            "cached_statements": len(self.statements),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "fallbacks": self.fallbacks,
+            "reuse_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "avg_prepare_ms": round(avg_prepare_ms, 3),
+            "avg_cold_execute_ms": round(avg_cold_ms, 3),
+            "avg_warm_execute_ms": round(avg_warm_ms, 3),
+            # Every hit skips a PREPARE (parse + analyze + rewrite); once Postgres
+            # switches to a generic plan the planning step is skipped as well
+            "estimated_saved_ms": round(self.hits * (avg_prepare_ms + max(avg_cold_ms - avg_warm_ms, 0.0)), 3),
+        }
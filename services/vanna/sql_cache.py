@@ -0,0 +1,39 @@
+"""
+Generated SQL Cache
+Remembers recently generated SQL under a short id so follow-up requests
+(such as exports) can reuse it without asking the LLM again
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+from sql_params import normalize_sql
+
+
+class SqlCache:
+    def __init__(self, max_size: int = 500):
+        self.max_size = max_size
+        self.entries = OrderedDict()  # sql id -> (tenant key, sql)
+        self.lock = threading.Lock()
+
+    def add(self, sql: str, tenant_key: str = None) -> str:
+        """Store SQL for a tenant and return its id"""
+        key_source = f"{tenant_key or ''}\n{normalize_sql(sql)}"
+        sql_id = hashlib.sha1(key_source.encode("utf-8")).hexdigest()[:16]
+        with self.lock:
+            self.entries[sql_id] = (tenant_key, sql)
+            self.entries.move_to_end(sql_id)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return sql_id
+
+    def get(self, sql_id: str, tenant_key: str = None):
+        """Return cached SQL for an id, or None when it has expired or
+        belongs to another tenant"""
+        with self.lock:
+            entry = self.entries.get(sql_id)
+            if entry is None or entry[0] != tenant_key:
+                return None
+            self.entries.move_to_end(sql_id)
+            return entry[1]
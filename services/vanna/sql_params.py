@@ -0,0 +1,206 @@
+"""
+SQL Parameterization
+Pulls literal values out of generated SQL so repeated query shapes share
+one normalized statement fingerprint
+"""
+
+import hashlib
+import re
+from decimal import Decimal
+
+# Token patterns, tried in order
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<comment>--[^\n]*)
+  | (?P<dollar>\$(?P<tag>(?:[A-Za-z_][A-Za-z0-9_]*)?)\$.*?\$(?P=tag)\$)
+  | (?P<placeholder>\$\d+)
+  | (?P<estring>[Ee]'(?:[^'\\]|''|\\.)*')
+  | (?P<string>'(?:[^']|'')*')
+  | (?P<ident>"(?:[^"]|"")*")
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+  | (?P<op>::|[-+*/<>=~!@\#%^&|`?]+|.)
+""", re.VERBOSE | re.DOTALL)
+
+# Characters that let a multi-character operator end in + or -
+OPERATOR_SPECIALS = set("~!@#%^&|`?")
+
+# A literal directly after one of these is a value, not part of the query shape
+VALUE_CONTEXT = {"=", "<>", "!=", "<", ">", "<=", ">=", "like", "ilike", "limit", "offset", "between"}
+
+# Typed literals such as INTERVAL '90 days' or DATE '2025-01-01' must stay inline
+TYPED_LITERAL_PREFIXES = {"interval", "date", "time", "timestamp", "timestamptz", "e", "b", "x", "n", "u&"}
+
+
+def tokenize_spans(sql: str):
+    """Split SQL into (kind, text, start, end) tokens, following the Postgres lexer"""
+    tokens = []
+    pos = 0
+    while pos < len(sql):
+        if sql.startswith("/*", pos):
+            end = _block_comment_end(sql, pos)
+            tokens.append(("comment", sql[pos:end], pos, end))
+            pos = end
+            continue
+        match = TOKEN_PATTERN.match(sql, pos)
+        kind = match.lastgroup
+        if kind == "tag":
+            kind = "dollar"
+        end = match.end()
+        if kind == "op" and end - pos > 1:
+            end = _operator_end(sql, pos, end)
+        tokens.append((kind, sql[pos:end], pos, end))
+        pos = end
+    return tokens
+
+
+def _block_comment_end(sql: str, start: int) -> int:
+    """End of the /* ... */ comment at start; Postgres block comments nest"""
+    depth = 0
+    pos = start
+    while pos < len(sql):
+        if sql.startswith("/*", pos):
+            depth += 1
+            pos += 2
+        elif sql.startswith("*/", pos):
+            depth -= 1
+            pos += 2
+            if depth == 0:
+                return pos
+        else:
+            pos += 1
+    return len(sql)  # unterminated: Postgres rejects it, treat the rest as comment
+
+
+def _operator_end(sql: str, start: int, end: int) -> int:
+    """Trim an operator run the way Postgres does
+
+    An operator stops before an embedded comment start, and may only end in
+    + or - when it contains one of OPERATOR_SPECIALS (so "=-1" is "=" "-1").
+    """
+    text = sql[start:end]
+    for marker in ("--", "/*"):
+        at = text.find(marker, 1)
+        if at != -1:
+            text = text[:at]
+    if not OPERATOR_SPECIALS & set(text):
+        while len(text) > 1 and text[-1] in "+-":
+            text = text[:-1]
+    return start + len(text)
+
+
+def tokenize(sql: str):
+    """Split SQL into (kind, text) tokens"""
+    return [(kind, text) for kind, text, _, _ in tokenize_spans(sql)]
+
+
+def _literal_value(kind: str, text: str):
+    """Convert a literal token into the Python value psycopg2 should bind"""
+    if kind == "string":
+        return text[1:-1].replace("''", "'")
+    if re.fullmatch(r"\d+", text):
+        return int(text)
+    return Decimal(text)
+
+
+def parameterize_sql(sql: str):
+    """
+    Replace value literals in SQL with $n placeholders
+
+    Returns (statement, params). The statement is whitespace-collapsed with
+    comments removed and unquoted words lowercased, so two queries that only
+    differ in their literal values produce the same statement text.
+    Only literals in value positions (comparisons, IN lists, BETWEEN,
+    LIMIT/OFFSET) are extracted; literals inside function arguments, GROUP BY
+    and ORDER BY keep their meaning and stay inline.
+    """
+    tokens = [t for t in tokenize(sql) if t[0] not in ("space", "comment")]
+
+    # Leave SQL that already carries placeholders untouched
+    if any(kind == "placeholder" for kind, _ in tokens):
+        return normalize_sql(sql), []
+
+    parts = []
+    params = []
+    prev = None  # previous significant token text (lowercased)
+    in_list_depth = None  # paren depth of an open IN (...) list
+    between_pending = False
+    depth = 0
+
+    for kind, text in tokens:
+        lowered = text.lower()
+
+        if kind in ("string", "number"):
+            in_value_list = in_list_depth == depth and prev in ("(", ",")
+            after_between_and = between_pending and prev == "and"
+            is_value = (prev in VALUE_CONTEXT or in_value_list or after_between_and) \
+                and prev not in TYPED_LITERAL_PREFIXES
+            if is_value:
+                params.append(_literal_value(kind, text))
+                parts.append(f"${len(params)}")
+                if after_between_and:
+                    between_pending = False
+                elif prev == "between":
+                    between_pending = True
+            else:
+                parts.append(text)
+        elif kind == "word":
+            parts.append(lowered)
+        else:
+            parts.append(text)
+
+        if text == "(":
+            depth += 1
+            if prev == "in":
+                in_list_depth = depth
+        elif text == ")":
+            if in_list_depth == depth:
+                in_list_depth = None
+            depth -= 1
+
+        prev = lowered
+
+    return join_tokens(parts), params
+
+
+def normalize_sql(sql: str) -> str:
+    """Collapse whitespace, drop comments and lowercase unquoted words"""
+    parts = []
+    for kind, text in tokenize(sql):
+        if kind in ("space", "comment"):
+            continue
+        parts.append(text.lower() if kind == "word" else text)
+    return join_tokens(parts)
+
+
+def join_tokens(parts) -> str:
+    """Join tokens with single spaces, keeping punctuation tight"""
+    while parts and parts[-1] == ";":
+        parts = parts[:-1]
+    out = []
+    for i, text in enumerate(parts):
+        tight = text in (")", ",", ".", "::") or parts[i - 1] in ("(", ".", "::") \
+            or (text == "(" and re.fullmatch(r"[A-Za-z_][A-Za-z0-9_$]*", parts[i - 1]))
+        if i and not tight:
+            out.append(" ")
+        out.append(text)
+    return "".join(out)
+
+
+def param_kinds(params) -> str:
+    """Comma-separated kind (int, decimal or string) of each extracted value"""
+    return ",".join(
+        "int" if isinstance(p, int) else "decimal" if isinstance(p, Decimal) else "string"
+        for p in params
+    )
+
+
+def fingerprint(statement: str, params=()) -> str:
+    """Stable short hash of a normalized statement
+
+    With params, the kind of each value is part of the hash: Postgres infers
+    a prepared statement's parameter types from its first use, so "> 2" and
+    "> 2.5" must not share one (a bigint $1 would round 2.5 to 3).
+    """
+    key = statement if not params else f"{statement}\n{param_kinds(params)}"
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
@@ -0,0 +1,288 @@
+"""
+Tenant Scoping
+Rewrites generated SQL so every referenced table only exposes rows that
+belong to the caller's organization (and optionally department)
+"""
+
+from sql_params import tokenize_spans
+
+# Tables whose rows hang off an invoice, scoped by joining through invoices
+INVOICE_CHILD_TABLES = {
+    "extracted_data", "line_items", "payments", "validated_data", "invoice_metadata",
+}
+
+# Every other table is refused: reading it cannot be limited to one tenant
+SCOPED_TABLES = INVOICE_CHILD_TABLES | {"invoices", "departments", "organizations"}
+
+# Keywords that can follow a table reference, so they are never aliases
+NON_ALIAS_KEYWORDS = {
+    "where", "join", "inner", "left", "right", "full", "cross", "natural", "on", "using",
+    "group", "order", "limit", "offset", "having", "union", "intersect", "except",
+    "window", "fetch", "for", "tablesample",
+}
+
+# Keywords that end a FROM list at the current nesting level. ON/USING only
+# end a join condition: a later top-level comma still adds a table
+FROM_LIST_END = {
+    "where", "group", "order", "having", "limit", "offset", "window", "union", "intersect",
+    "except", "select", "returning", "fetch", "for", "values",
+}
+
+# Functions whose arguments use FROM without referring to a table
+FROM_SYNTAX_FUNCTIONS = {"extract", "substring", "trim", "overlay", "position"}
+
+# Words that make a statement write data or run other statements
+WRITE_KEYWORDS = {
+    "insert", "update", "delete", "merge", "truncate", "into", "copy", "execute", "call", "do",
+}
+
+# Functions that run SQL text, reach outside the database or change session state
+DENIED_FUNCTION_PREFIXES = (
+    "query_to_xml", "cursor_to_xml", "table_to_xml", "schema_to_xml", "database_to_xml",
+    "dblink", "pg_read_", "pg_ls_", "pg_stat_file", "pg_file_", "lo_",
+)
+DENIED_FUNCTIONS = {
+    "ts_stat", "ts_rewrite", "set_config", "pg_sleep", "pg_terminate_backend",
+    "pg_cancel_backend", "pg_reload_conf", "nextval", "setval",
+}
+
+
+class TenantContext:
+    def __init__(self, organization_id: str, department_id: str = None):
+        if not organization_id:
+            raise ValueError("organization_id is required for tenant scoping")
+        self.organization_id = organization_id
+        self.department_id = department_id
+
+    @property
+    def cache_key(self) -> str:
+        """Stable key that keeps cached entries from leaking across tenants"""
+        return f"{self.organization_id}/{self.department_id or '*'}"
+
+
+def _quote(value: str) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _invoice_filter(alias: str, tenant: TenantContext) -> str:
+    """Predicates on the indexed invoices.organizationId / departmentId columns"""
+    sql = f'{alias}."organizationId" = {_quote(tenant.organization_id)}'
+    if tenant.department_id:
+        sql += f' AND {alias}."departmentId" = {_quote(tenant.department_id)}'
+    return sql
+
+
+def scoped_table_sql(table: str, tenant: TenantContext, sample: str = None) -> str:
+    """Subquery exposing only the tenant's rows of a table
+
+    Postgres pulls these simple subqueries up into the outer query, so the
+    tenant predicates are planned against the organizationId/departmentId
+    indexes on invoices and the unique invoiceId keys of the child tables.
+    A TABLESAMPLE clause on the original reference moves inside the subquery.
+    """
+    sample = f" {sample}" if sample else ""
+    if table == "invoices":
+        return f"(SELECT * FROM invoices tenant_i{sample} WHERE {_invoice_filter('tenant_i', tenant)})"
+    if table in INVOICE_CHILD_TABLES:
+        return (
+            f'(SELECT tenant_t.* FROM {table} tenant_t{sample} '
+            f'JOIN invoices tenant_i ON tenant_i."id" = tenant_t."invoiceId" '
+            f"WHERE {_invoice_filter('tenant_i', tenant)})"
+        )
+    if table == "departments":
+        sql = f'(SELECT * FROM departments tenant_d{sample} WHERE tenant_d."organizationId" = {_quote(tenant.organization_id)}'
+        if tenant.department_id:
+            sql += f' AND tenant_d."id" = {_quote(tenant.department_id)}'
+        return sql + ")"
+    if table == "organizations":
+        return f'(SELECT * FROM organizations tenant_o{sample} WHERE tenant_o."id" = {_quote(tenant.organization_id)})'
+    return None
+
+
+def _tablesample_end(tokens, start: int) -> int:
+    """Index just past a TABLESAMPLE method (...) [REPEATABLE (...)] clause at start"""
+    if start >= len(tokens) or tokens[start][1].lower() != "tablesample":
+        return start
+    i = start + 2  # TABLESAMPLE <method>
+    for keyword in (None, "repeatable"):
+        if keyword:
+            if i >= len(tokens) or tokens[i][1].lower() != keyword:
+                break
+            i += 1
+        depth = 0
+        while i < len(tokens):
+            if tokens[i][1] == "(":
+                depth += 1
+            elif tokens[i][1] == ")":
+                depth -= 1
+                if depth == 0:
+                    i += 1
+                    break
+            i += 1
+    return i
+
+
+def _table_name(kind: str, text: str):
+    if kind == "ident":
+        return text[1:-1]
+    if kind == "word":
+        return text.lower()
+    return None
+
+
+def _skip_parens(tokens, open_at: int) -> int:
+    """Index just past the parenthesised group opening at open_at"""
+    depth = 0
+    for i in range(open_at, len(tokens)):
+        if tokens[i][1] == "(":
+            depth += 1
+        elif tokens[i][1] == ")":
+            depth -= 1
+            if depth == 0:
+                return i + 1
+    return len(tokens)
+
+
+def _with_names(tokens, with_at: int):
+    """Names defined by the WITH [RECURSIVE] name [(cols)] AS (...), ... list at with_at"""
+    names = set()
+    i = with_at + 1
+    if i < len(tokens) and tokens[i][1].lower() == "recursive":
+        i += 1
+    while i < len(tokens) and tokens[i][0] in ("word", "ident"):
+        names.add(_table_name(tokens[i][0], tokens[i][1]))
+        i += 1
+        if i < len(tokens) and tokens[i][1] == "(":
+            i = _skip_parens(tokens, i)
+        if i >= len(tokens) or tokens[i][1].lower() != "as":
+            break
+        i += 1
+        while i < len(tokens) and tokens[i][1].lower() in ("not", "materialized"):
+            i += 1
+        if i >= len(tokens) or tokens[i][1] != "(":
+            break
+        i = _skip_parens(tokens, i)
+        if i >= len(tokens) or tokens[i][1] != ",":
+            break
+        i += 1
+    return names
+
+
+def validate_select_only(tokens):
+    """Raise ValueError unless tokens form a single read-only SELECT/WITH statement"""
+    words = [t for t in tokens if t[1] != "("]
+    if not words or words[0][1].lower() not in ("select", "with"):
+        raise ValueError("Only a single SELECT or WITH query can be scoped to a tenant")
+
+    for i, (kind, text, _, _) in enumerate(tokens):
+        lowered = text.lower()
+        if text == ";" and any(t[1] != ";" for t in tokens[i + 1:]):
+            raise ValueError("Multiple statements cannot be scoped to a tenant")
+        if kind != "word" and kind != "ident":
+            continue
+        name = _table_name(kind, text)
+        if kind == "word" and lowered in WRITE_KEYWORDS:
+            raise ValueError(f"{text.upper()} is not allowed in a tenant-scoped query")
+        if kind == "word" and lowered == "table":
+            raise ValueError("TABLE references cannot be scoped to a tenant")
+        is_call = i + 1 < len(tokens) and tokens[i + 1][1] == "("
+        if is_call and (name in DENIED_FUNCTIONS or name.startswith(DENIED_FUNCTION_PREFIXES)):
+            raise ValueError(f"Function {name} is not allowed in a tenant-scoped query")
+
+
+def scope_sql(sql: str, tenant: TenantContext) -> str:
+    """
+    Replace every table reference in SQL with its tenant-scoped subquery
+
+    Only a single read-only SELECT/WITH statement is accepted. Raises
+    ValueError for anything else, and when the SQL reads from a table that
+    has no tenant scoping rule, so unscoped rows are never returned. The
+    subqueries are spliced into the original text, which is otherwise kept
+    byte for byte.
+    """
+    tokens = [t for t in tokenize_spans(sql) if t[0] not in ("space", "comment")]
+    validate_select_only(tokens)
+
+    edits = []  # (start, end, replacement) on the original SQL
+    # Per paren level: [opened by FROM-syntax function, inside FROM list, CTE names].
+    # A CTE is visible in the (sub)query whose leading WITH defines it and
+    # in everything nested inside that query
+    stack = [[False, False, set()]]
+    i = 0
+    while i < len(tokens):
+        kind, text, start, end = tokens[i]
+        lowered = text.lower()
+        prev = tokens[i - 1][1].lower() if i else None
+        in_function, in_from, _ = stack[-1]
+
+        if text == "(":
+            stack.append([prev in FROM_SYNTAX_FUNCTIONS, False, set()])
+        elif text == ")":
+            if len(stack) > 1:
+                stack.pop()
+        elif kind == "word" and lowered == "with" and prev in (None, "("):
+            stack[-1][2] |= _with_names(tokens, i)
+        elif kind == "word" and not in_function:
+            if lowered in ("from", "join"):
+                stack[-1][1] = True
+            elif lowered in FROM_LIST_END:
+                stack[-1][1] = False
+
+        # IS [NOT] DISTINCT FROM compares values, it does not read a table
+        distinct_from = prev == "from" and i > 1 and tokens[i - 2][1].lower() == "distinct"
+        is_reference = not in_function and not distinct_from and (
+            prev in ("from", "join") or (prev == "," and in_from)
+        )
+        if not is_reference or kind not in ("word", "ident") or lowered == "lateral":
+            i += 1
+            continue
+
+        # Schema-qualified references: public.extracted_data is fine, other
+        # schemas (pg_catalog, information_schema) are refused outright
+        name = _table_name(kind, text)
+        ref_start = start
+        next_text = tokens[i + 1][1] if i + 1 < len(tokens) else None
+        if next_text == ".":
+            if name != "public" or i + 2 >= len(tokens):
+                raise ValueError(f"Schema {name} cannot be scoped to a tenant")
+            i += 2
+            kind, text, start, end = tokens[i]
+            name = _table_name(kind, text)
+            next_text = tokens[i + 1][1] if i + 1 < len(tokens) else None
+            if name is None:
+                raise ValueError("Unrecognised table reference")
+
+        if next_text == "(":
+            i += 1  # set-returning function in FROM
+            continue
+
+        if name in SCOPED_TABLES:
+            # Keep the original alias, or alias the subquery with the table name
+            alias_at = i + 1
+            if alias_at < len(tokens) and tokens[alias_at][1].lower() == "as":
+                alias_at += 1
+            has_alias = alias_at < len(tokens) \
+                and tokens[alias_at][0] in ("word", "ident") \
+                and tokens[alias_at][1].lower() not in NON_ALIAS_KEYWORDS
+            reference_end = alias_at + 1 if has_alias else i + 1
+            sample_end = _tablesample_end(tokens, reference_end)
+            sample = None
+            if sample_end > reference_end:
+                sample_start = tokens[reference_end][2]
+                sample = sql[sample_start:tokens[sample_end - 1][3]]
+                edits.append((sample_start, tokens[sample_end - 1][3], ""))
+
+            replacement = scoped_table_sql(name, tenant, sample)
+            if not has_alias:
+                replacement += f" AS {name}"
+            edits.append((ref_start, end, replacement))
+            i = sample_end
+            continue
+
+        if not any(name in level[2] for level in stack):
+            raise ValueError(f"Table {name} cannot be scoped to a tenant")
+        i += 1
+
+    for start, end, replacement in sorted(edits, reverse=True):
+        sql = sql[:start] + replacement + sql[end:]
+    return sql
@@ -0,0 +1,46 @@
+"""
+Sample-query catalog tests: questions never cross organizations
+"""
+
+from answer_warmer import AnswerWarmer, QuestionUsage, SEED_QUESTIONS, build_catalog
+from tenant_scope import TenantContext
+
+
+def _usage():
+    usage = QuestionUsage(path="")
+    for _ in range(3):
+        usage.record("Spend for Acme secret project", TenantContext("org_a"))
+    usage.record("Total spend?")
+    return usage
+
+
+def test_unscoped_catalog_only_uses_unscoped_questions():
+    catalog = build_catalog(_usage(), 5)
+    assert catalog[0] == "Total spend?"
+    assert "Spend for Acme secret project" not in catalog
+    assert catalog[1:] == SEED_QUESTIONS[:4]
+
+
+def test_organization_catalog_only_uses_its_questions():
+    assert build_catalog(_usage(), 1, "org_a") == ["Spend for Acme secret project"]
+    assert "Spend for Acme secret project" not in build_catalog(_usage(), 11, "org_b")
+
+
+def test_warm_targets_keep_tenant_questions_scoped():
+    warmer = AnswerWarmer(None, None, _usage(), catalog_size=3)
+    for question, tenant in warmer.targets().values():
+        if question == "Spend for Acme secret project":
+            assert tenant is not None and tenant.organization_id == "org_a"
+
+
+def test_question_log_rotates_and_reloads_both_files(tmp_path):
+    path = str(tmp_path / "questions.jsonl")
+    usage = QuestionUsage(path, max_bytes=200)
+    for i in range(6):
+        usage.record(f"Question {i}")
+    assert (tmp_path / "questions.jsonl.1").exists()
+    assert (tmp_path / "questions.jsonl").stat().st_size < 400
+
+    reloaded = QuestionUsage(path, max_bytes=200)
+    assert len(reloaded.events) >= 2
+    assert reloaded.events[-1][2] == "Question 5"
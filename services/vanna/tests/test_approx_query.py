@@ -0,0 +1,31 @@
+"""
+Approximate rewrite tests
+"""
+
+from approx_query import rewrite_approx, sampled_table
+
+
+def test_unaliased_aggregates_get_unique_aliases():
+    rewrite = rewrite_approx('SELECT SUM("total"), SUM("tax"), COUNT(*) FROM extracted_data', 1)
+    assert rewrite.margins == {"sum": "sum_margin", "sum_2": "sum_2_margin", "count": "count_margin"}
+    assert rewrite.sql.count('AS "sum"') == 1
+
+
+def test_sample_follows_table_before_natural_join():
+    rewrite = rewrite_approx("SELECT COUNT(*) FROM extracted_data NATURAL JOIN line_items", 2)
+    assert "FROM extracted_data TABLESAMPLE SYSTEM (2) NATURAL JOIN line_items" in rewrite.sql
+
+
+def test_sample_follows_alias():
+    rewrite = rewrite_approx('SELECT AVG(ed."total") FROM extracted_data AS ed WHERE ed."total" > 0', 5)
+    assert 'FROM extracted_data AS ed TABLESAMPLE SYSTEM (5) WHERE' in rewrite.sql
+
+
+def test_sampled_row_count_is_appended():
+    rewrite = rewrite_approx('SELECT "category", SUM("total") FROM line_items GROUP BY 1', 1)
+    assert rewrite.sql.split(" FROM ")[0].endswith('COUNT(*) AS "sampled_rows"')
+
+
+def test_ineligible_queries_are_not_sampled():
+    assert sampled_table('SELECT MAX("total") FROM extracted_data') is None
+    assert sampled_table("SELECT COUNT(*) FROM invoices") is None
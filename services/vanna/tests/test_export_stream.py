@@ -0,0 +1,32 @@
+"""
+Export streaming tests: XLSX sheet limits and export slots
+"""
+
+import io
+
+import pytest
+
+pytest.importorskip("psycopg2")
+openpyxl = pytest.importorskip("openpyxl")
+
+import export_stream
+from export_stream import ExportBusyError, ExportStats, export_query, stream_xlsx
+
+
+def test_xlsx_continues_on_a_new_sheet_at_the_row_limit(monkeypatch):
+    monkeypatch.setattr(export_stream, "XLSX_MAX_ROWS", 3)
+    monkeypatch.setattr(
+        export_stream, "_batches",
+        lambda connection, sql, batch_size: iter([(["n"], [23], [(1,), (2,), (3,), (4,), (5,)])]),
+    )
+    data = b"".join(stream_xlsx(None, "SELECT n", ExportStats("xlsx")))
+    workbook = openpyxl.load_workbook(io.BytesIO(data))
+    assert workbook.sheetnames == ["Results", "Results 2", "Results 3"]
+    assert [[c.value for c in row] for row in workbook["Results 2"].iter_rows()] == [["n"], [3], [4]]
+
+
+def test_export_is_refused_when_every_slot_is_taken(monkeypatch):
+    monkeypatch.setattr(export_stream, "export_slots", export_stream.threading.BoundedSemaphore(1))
+    export_stream.export_slots.acquire()
+    with pytest.raises(ExportBusyError):
+        next(export_query("postgresql://unused", "SELECT 1", "csv"))
@@ -0,0 +1,79 @@
+"""
+Index advisor tests: partial index predicates
+"""
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+from index_advisor import ExistingIndex, IndexProposal, advise
+from sql_params import parameterize_sql, fingerprint
+from tenant_scope import TenantContext, scope_sql
+from workload import param_digest
+
+
+def _executions(sql, count):
+    statement, params = parameterize_sql(sql)
+    return [
+        {
+            "fingerprint": fingerprint(statement),
+            "statement": statement,
+            "param_digests": [param_digest(p) for p in params],
+            "duration_ms": 100.0,
+        }
+        for _ in range(count)
+    ]
+
+
+def _resolve(table, column, digest):
+    return next((v for v in ("PAID", "PENDING") if param_digest(v) == digest), None)
+
+
+def test_tenant_columns_never_become_partial_predicates():
+    entries = _executions(
+        "SELECT * FROM invoices WHERE \"organizationId\" = 'org_a' AND \"id\" = 'inv_1'", 20
+    )
+    ddls = [p.ddl() for p in advise(entries, {}, lambda *args: "org_a")]
+    assert ddls
+    assert not any("WHERE" in ddl for ddl in ddls)
+
+
+def test_constant_needs_enough_executions():
+    sql = "SELECT * FROM invoices WHERE \"status\" = 'PAID' AND \"processedAt\" > '2025-01-01'"
+    assert not any(p.where for p in advise(_executions(sql, 2), {}, _resolve))
+    partial = [p for p in advise(_executions(sql, 10), {}, _resolve) if p.where]
+    assert partial and partial[0].where == "\"status\" = 'PAID'"
+
+
+def test_constants_need_a_resolver():
+    sql = "SELECT * FROM invoices WHERE \"status\" = 'PAID' AND \"processedAt\" > '2025-01-01'"
+    assert not any(p.where for p in advise(_executions(sql, 10), {}))
+
+
+def test_tenant_scoped_sql_gets_the_same_proposals():
+    sql = 'SELECT ed."vendorName" FROM extracted_data ed WHERE ed."dueDate" < NOW()'
+    raw = [p.ddl() for p in advise(_executions(sql, 1))]
+    scoped = [p.ddl() for p in advise(_executions(scope_sql(sql, TenantContext("org_a")), 1))]
+    assert raw == scoped
+    assert any('("dueDate")' in ddl for ddl in scoped)
+
+
+def test_existing_indexes_match_as_postgres_deparses_them():
+    partial = IndexProposal("invoices", ["processedAt"], where="\"status\" = 'PAID'")
+    assert partial.is_covered_by([ExistingIndex(['"processedAt"'], where="(status)::text = 'PAID'::text")])
+    assert not partial.is_covered_by([ExistingIndex(['"processedAt"'])])
+
+    covering = IndexProposal("extracted_data", ["dueDate"], include=["vendorName"])
+    assert covering.is_covered_by([ExistingIndex(['"dueDate"'], include=['"vendorName"'])])
+    assert not covering.is_covered_by([ExistingIndex(['"dueDate"'])])
+
+    expression = IndexProposal("extracted_data", ['EXTRACT(YEAR FROM "invoiceDate")'], expression=True)
+    assert expression.is_covered_by([ExistingIndex(['EXTRACT(year FROM "invoiceDate")'])])
+    assert expression.is_covered_by([ExistingIndex(["date_part('year'::text, x)"], name=expression.name)])
+
+
+def test_newest_plan_is_used():
+    entries = _executions('SELECT * FROM extracted_data WHERE "dueDate" < NOW()', 2)
+    entries[0]["plan"] = {"Node Type": "Seq Scan", "Relation Name": "extracted_data", "Total Cost": 10}
+    entries[1]["plan"] = {"Node Type": "Index Scan", "Relation Name": "extracted_data", "Total Cost": 1}
+    assert advise(entries) == []
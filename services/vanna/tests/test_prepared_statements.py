@@ -0,0 +1,80 @@
+"""
+Prepared statement cache tests, against a recording connection
+"""
+
+from prepared_statements import PreparedStatementCache
+
+
+class RecordingCursor:
+    def __init__(self, fail_prepare=False):
+        self.executed = []
+        self.fail_prepare = fail_prepare
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+        if self.fail_prepare and sql.startswith("PREPARE"):
+            raise RuntimeError("could not determine data type of parameter $1")
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_repeated_shape_reuses_the_prepared_statement():
+    cache = PreparedStatementCache(RecordingConnection())
+    cursor = RecordingCursor()
+    first = cache.execute(cursor, "SELECT * FROM invoices WHERE \"status\" = 'PAID'")
+    second = cache.execute(cursor, "SELECT * FROM invoices WHERE \"status\" = 'PENDING'")
+    assert first == second
+    assert [sql for sql, _ in cursor.executed if sql.startswith("PREPARE")] == [
+        f'PREPARE fbq_{first} AS select * from invoices where "status" = $1'
+    ]
+    assert cursor.executed[-1] == (f"EXECUTE fbq_{first} (%s)", ["PENDING"])
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_value_kinds_get_separate_statements():
+    cache = PreparedStatementCache(RecordingConnection())
+    cursor = RecordingCursor()
+    assert cache.execute(cursor, "SELECT 1 FROM invoices HAVING COUNT(*) > 2") \
+        != cache.execute(cursor, "SELECT 1 FROM invoices HAVING COUNT(*) > 2.5")
+    assert cache.misses == 2
+
+
+def test_failed_prepare_falls_back_to_plain_sql():
+    connection = RecordingConnection()
+    cache = PreparedStatementCache(connection)
+    cursor = RecordingCursor(fail_prepare=True)
+    sql = "SELECT * FROM invoices WHERE \"status\" = 'PAID'"
+    assert cache.execute(cursor, sql) is None
+    assert cursor.executed[-1] == (sql, None)
+    assert connection.rollbacks == 1
+
+    # The shape is remembered, so it is not prepared again
+    cursor.executed.clear()
+    assert cache.execute(cursor, sql) is None
+    assert cursor.executed == [(sql, None)]
+    assert cache.fallbacks == 2
+
+
+def test_writes_run_as_plain_sql():
+    cursor = RecordingCursor()
+    sql = "UPDATE invoices SET \"status\" = 'PAID'"
+    assert PreparedStatementCache(RecordingConnection()).execute(cursor, sql) is None
+    assert cursor.executed == [(sql, None)]
+
+
+def test_least_recently_used_statement_is_deallocated():
+    cache = PreparedStatementCache(RecordingConnection(), max_size=2)
+    cursor = RecordingCursor()
+    first = cache.execute(cursor, "SELECT * FROM invoices WHERE \"status\" = 'PAID'")
+    second = cache.execute(cursor, "SELECT * FROM invoices WHERE \"name\" = 'a'")
+    cache.execute(cursor, "SELECT * FROM invoices WHERE \"status\" = 'PENDING'")  # first is now recent
+    cache.execute(cursor, "SELECT * FROM invoices WHERE \"id\" = 'x'")
+    assert (f"DEALLOCATE fbq_{second}", None) in cursor.executed
+    assert list(cache.statements) == [first, cache.execute(cursor, "SELECT * FROM invoices WHERE \"id\" = 'y'")]
+    assert cache.evictions == 1
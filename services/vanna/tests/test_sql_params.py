@@ -0,0 +1,57 @@
+"""
+SQL parameterization tests
+"""
+
+from decimal import Decimal
+
+from sql_params import fingerprint, normalize_sql, parameterize_sql
+
+
+def test_normalization_collapses_whitespace_comments_and_case():
+    assert normalize_sql('SELECT  *\n FROM Invoices -- all\n WHERE "Status" = \'PAID\';') \
+        == 'select * from invoices where "Status" = \'PAID\''
+
+
+def test_same_shape_with_different_values_shares_a_statement():
+    first, first_params = parameterize_sql("SELECT * FROM invoices WHERE \"status\" = 'PAID' LIMIT 10")
+    second, second_params = parameterize_sql("select * from invoices where \"status\" = 'PENDING' limit 5")
+    assert first == second == 'select * from invoices where "status" = $1 limit $2'
+    assert first_params == ["PAID", 10]
+    assert second_params == ["PENDING", 5]
+
+
+def test_in_list_and_between_values_are_extracted():
+    statement, params = parameterize_sql(
+        "SELECT * FROM invoices WHERE \"status\" IN ('PAID', 'PENDING') "
+        "AND \"total\" BETWEEN 10 AND 20.5"
+    )
+    assert statement == 'select * from invoices where "status" in($1, $2) and "total" between $3 and $4'
+    assert params == ["PAID", "PENDING", 10, Decimal("20.5")]
+
+
+def test_typed_literals_and_function_arguments_stay_inline():
+    statement, params = parameterize_sql(
+        "SELECT DATE_TRUNC('month', \"invoiceDate\") FROM extracted_data "
+        "WHERE \"invoiceDate\" > NOW() - INTERVAL '90 days' AND \"invoiceDate\" >= DATE '2025-01-01' "
+        "GROUP BY 1 ORDER BY 1"
+    )
+    assert "'month'" in statement and "INTERVAL '90 days'".lower() in statement.lower()
+    assert "DATE '2025-01-01'".lower() in statement.lower()
+    assert "group by 1 order by 1" in statement
+    assert params == []
+
+
+def test_sql_with_placeholders_is_left_alone():
+    assert parameterize_sql("SELECT * FROM invoices WHERE \"id\" = $1")[1] == []
+
+
+def test_fingerprint_separates_value_kinds():
+    int_statement, int_params = parameterize_sql("SELECT 1 FROM invoices HAVING COUNT(*) > 2")
+    dec_statement, dec_params = parameterize_sql("SELECT 1 FROM invoices HAVING COUNT(*) > 2.5")
+    assert int_statement == dec_statement
+    assert fingerprint(int_statement, int_params) != fingerprint(dec_statement, dec_params)
+    assert fingerprint(int_statement, [3]) == fingerprint(int_statement, int_params)
+
+    num_statement, num_params = parameterize_sql("SELECT * FROM extracted_data WHERE \"invoiceNumber\" = 123")
+    str_statement, str_params = parameterize_sql("SELECT * FROM extracted_data WHERE \"invoiceNumber\" = '123'")
+    assert fingerprint(num_statement, num_params) != fingerprint(str_statement, str_params)
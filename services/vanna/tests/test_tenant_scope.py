@@ -0,0 +1,109 @@
+"""
+Tenant scoping tests: every table reference must be scoped or refused
+"""
+
+import pytest
+
+from tenant_scope import TenantContext, scope_sql
+
+TENANT = TenantContext("org_a")
+ORG_FILTER = "\"organizationId\" = 'org_a'"
+
+
+@pytest.mark.parametrize("sql", [
+    "TABLE invoices",
+    "SELECT * FROM (TABLE invoices) x",
+    "SELECT query_to_xml('select * from invoices', true, true, '')",
+    "SELECT cursor_to_xml('c', 10, true, true, '')",
+    "SELECT * FROM dblink('dbname=app', 'select * from invoices') AS t(id text)",
+    'SELECT * FROM "extracted_data" ed, pg_user u',
+    "SELECT * FROM invoices i, users u",
+    "SELECT * FROM (SELECT * FROM invoices) i, pg_shadow s",
+    "UPDATE invoices SET \"status\" = 'PAID'",
+    "INSERT INTO invoices (\"id\") VALUES ('x')",
+    "DELETE FROM invoices",
+    "WITH gone AS (DELETE FROM invoices RETURNING *) SELECT * FROM gone",
+    "SELECT * INTO stolen FROM invoices",
+    "SELECT 1; SELECT * FROM users",
+    "SELECT * FROM pg_catalog.pg_user",
+    "SELECT set_config('role', 'postgres', false)",
+    'SELECT * FROM invoices i JOIN line_items li ON li."invoiceId" = i."id", users u',
+    'SELECT * FROM invoices i JOIN payments p USING ("invoiceId"), users u',
+    "SELECT u.* FROM (SELECT * FROM users) u WINDOW w AS (), users AS ()",
+    "SELECT * FROM (WITH users AS (SELECT 1) SELECT * FROM users) x, users",
+    "SELECT * /* /* */ ' */ FROM users --'",
+    "SELECT $a1$ ' $a1$ FROM users",
+])
+def test_refuses_bypasses(sql):
+    with pytest.raises(ValueError):
+        scope_sql(sql, TENANT)
+
+
+def test_scopes_every_table_in_a_comma_join():
+    sql = scope_sql("SELECT * FROM invoices i, line_items li WHERE li.\"invoiceId\" = i.\"id\"", TENANT)
+    assert sql.count(ORG_FILTER) == 2
+    assert "FROM invoices i," not in sql
+
+
+def test_scopes_unaliased_table_and_keeps_the_name():
+    sql = scope_sql('SELECT COUNT(*) FROM invoices WHERE invoices."status" = \'PAID\'', TENANT)
+    assert sql.startswith("SELECT COUNT(*) FROM (SELECT * FROM invoices tenant_i WHERE")
+    assert sql.endswith(") AS invoices WHERE invoices.\"status\" = 'PAID'")
+
+
+def test_ctes_and_set_returning_functions_are_allowed():
+    sql = scope_sql(
+        "WITH recent AS (SELECT * FROM invoices) "
+        "SELECT * FROM recent r, generate_series(1, 3) g",
+        TENANT,
+    )
+    assert sql.count(ORG_FILTER) == 1
+
+
+def test_from_inside_expressions_is_not_a_table():
+    sql = scope_sql(
+        "SELECT EXTRACT(YEAR FROM i.\"issueDate\") FROM invoices i "
+        "WHERE i.\"status\" IS DISTINCT FROM 'PAID'",
+        TENANT,
+    )
+    assert sql.count(ORG_FILTER) == 1
+
+
+def test_department_scope():
+    sql = scope_sql("SELECT * FROM payments", TenantContext("org_a", "dept_1"))
+    assert "\"departmentId\" = 'dept_1'" in sql
+
+
+def test_tablesample_moves_inside_the_subquery():
+    sql = scope_sql("SELECT SUM(ed.\"total\") FROM extracted_data ed TABLESAMPLE SYSTEM (1.5)", TENANT)
+    assert "FROM extracted_data tenant_t TABLESAMPLE SYSTEM (1.5) JOIN" in sql
+    assert sql.rstrip().endswith(") ed")
+
+
+@pytest.mark.parametrize("predicate", [
+    "i.\"vendorName\" ~* 'gmbh$'",
+    "i.\"vendorName\" !~~* '%ltd%'",
+    "i.\"vendorName\" = E'O\\'Neil'",
+    "i.\"vendorName\" || '-x' = 'a-x'",
+    "i.\"total\" >= -1",
+])
+def test_original_sql_text_is_preserved(predicate):
+    sql = scope_sql(f"SELECT * FROM invoices i WHERE {predicate}", TENANT)
+    assert sql.endswith(f" i WHERE {predicate}")
+
+
+def test_comma_join_after_join_condition_is_scoped():
+    sql = scope_sql(
+        'SELECT * FROM invoices i JOIN line_items li ON li."invoiceId" = i."id", extracted_data ed',
+        TENANT,
+    )
+    assert sql.count(ORG_FILTER) == 3
+
+
+def test_cte_names_are_visible_in_nested_queries():
+    sql = scope_sql(
+        "WITH recent AS (SELECT * FROM invoices) "
+        "SELECT * FROM (SELECT * FROM recent) r WHERE EXISTS (SELECT 1 FROM recent)",
+        TENANT,
+    )
+    assert sql.count(ORG_FILTER) == 1
@@ -8,9 +8,16 @@ from groq import Groq
 import psycopg2
 from psycopg2.extras import RealDictCursor
 import json
+import time
+
+from prepared_statements import PreparedStatementCache
+from sql_cache import SqlCache
+from tenant_scope import scope_sql
+from approx_query import sampled_table, choose_sample_percent, rewrite_approx, MIN_SAMPLED_ROWS, SAMPLED_ROWS_COLUMN
+from workload import WorkloadRecorder
 
 class VannaConfig:
-    def __init__(self):
+    def __init__(self, record_workload: bool = True):
         self.database_url = os.getenv("DATABASE_URL")
         self.groq_api_key = os.getenv("GROQ_API_KEY")
         
@@ -24,6 +31,21 @@ class VannaConfig:
         
         # Connect to PostgreSQL
         self.db_connection = None
+        self.statement_cache = None
+        self.statement_cache_size = int(os.getenv("PREPARED_STATEMENT_CACHE_SIZE", 64))
+        
+        # Record generated SQL timings and plans for the index advisor
+        self.workload = WorkloadRecorder(
+            os.getenv("WORKLOAD_LOG_PATH", "workload.jsonl") if record_workload else "",
+            max_bytes=int(os.getenv("WORKLOAD_LOG_MAX_MB", 50)) * 1024 * 1024
+        )
+        
+        # Recently generated SQL, addressable by id for exports
+        self.sql_cache = SqlCache()
+        
+        # Approximate mode aims for roughly this many sampled rows
+        self.approx_target_rows = int(os.getenv("APPROX_TARGET_ROWS", 50000))
+        
         self.connect_to_database()
         
     def connect_to_database(self):
@@ -33,6 +55,12 @@ class VannaConfig:
                 self.database_url,
                 cursor_factory=RealDictCursor
             )
+            # Prepared statements live on the server session, so each new
+            # connection starts with an empty cache
+            self.statement_cache = PreparedStatementCache(
+                self.db_connection,
+                max_size=self.statement_cache_size
+            )
             print("✅ Connected to PostgreSQL database")
         except Exception as e:
             print(f"❌ Database connection failed: {e}")
@@ -178,16 +206,26 @@ Examples of CORRECT syntax:
             print(f"❌ SQL generation failed: {e}")
             raise
     
-    def run_sql(self, sql: str):
-        """Execute SQL and return results"""
+    def run_sql(self, sql: str, read_only: bool = False):
+        """Execute SQL and return results
+
+        With read_only, every transaction the query touches (including a
+        retry after a failed PREPARE) is READ ONLY, so tenant-scoped SQL can
+        never write even if it slips past the scoping checks.
+        """
         try:
             # Check connection and reconnect if needed
             if self.db_connection is None or self.db_connection.closed:
                 print("⚠️ Database connection closed, reconnecting...")
                 self.connect_to_database()
             
+            if read_only:
+                self.db_connection.rollback()
+                self.db_connection.set_session(readonly=True)
+            
             cursor = self.db_connection.cursor()
-            cursor.execute(sql)
+            start = time.perf_counter()
+            self.statement_cache.execute(cursor, sql)
             
             # Check if query returns results
             if cursor.description is None:
@@ -195,6 +233,9 @@ Examples of CORRECT syntax:
             
             columns = [desc[0] for desc in cursor.description]
             rows = cursor.fetchall()
+            duration_ms = (time.perf_counter() - start) * 1000
+            
+            self.workload.record(cursor, sql, duration_ms, len(rows))
             
             # Convert to list of dicts
             results = [dict(row) for row in rows]
@@ -220,15 +261,94 @@ Examples of CORRECT syntax:
             print(f"❌ SQL execution failed: {e}")
             self.db_connection.rollback()
             raise
+        finally:
+            if read_only and self.db_connection is not None and not self.db_connection.closed:
+                self.db_connection.rollback()
+                self.db_connection.set_session(readonly=False)
+    
+    def scope_to_tenant(self, sql: str, tenant=None) -> str:
+        """Restrict SQL to the tenant's rows (no-op without a tenant)"""
+        if tenant is None:
+            return sql
+        scoped = scope_sql(sql, tenant)
+        print(f"🔒 Scoped SQL to tenant {tenant.cache_key}")
+        return scoped
+    
+    def estimated_row_count(self, table: str) -> float:
+        """Planner row estimate for a table, read from pg_class"""
+        if self.db_connection is None or self.db_connection.closed:
+            self.connect_to_database()
+        cursor = self.db_connection.cursor()
+        cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s AND relkind = 'r'", (table,))
+        row = cursor.fetchone()
+        cursor.close()
+        return float(row['reltuples']) if row else 0.0
+    
+    def tenant_row_share(self, tenant) -> float:
+        """Fraction of all invoices that belong to the tenant"""
+        total = self.estimated_row_count("invoices")
+        if total <= 0:
+            return 1.0
+        sql = 'SELECT COUNT(*) AS n FROM invoices WHERE "organizationId" = %s'
+        params = [tenant.organization_id]
+        if tenant.department_id:
+            sql += ' AND "departmentId" = %s'
+            params.append(tenant.department_id)
+        cursor = self.db_connection.cursor()
+        cursor.execute(sql, params)
+        count = cursor.fetchone()['n']
+        cursor.close()
+        return min(count / total, 1.0)
     
-    def ask(self, question: str):
+    def approximate(self, sql: str, sample_percent: float = None, tenant=None):
+        """Sampled rewrite of aggregate SQL, or None when an exact run is cheap or required
+        
+        The sample is taken inside the tenant's scoped subquery, so it is sized
+        from the tenant's share of the table rather than the whole table.
+        """
+        table = sampled_table(sql)
+        if table is None:
+            return None
+        if sample_percent is None:
+            estimated_rows = self.estimated_row_count(table)
+            if tenant is not None:
+                estimated_rows *= self.tenant_row_share(tenant)
+            sample_percent = choose_sample_percent(estimated_rows, self.approx_target_rows)
+        if sample_percent >= 100:
+            return None
+        return rewrite_approx(sql, sample_percent)
+    
+    def ask(self, question: str, tenant=None, approx: bool = False, sample_percent: float = None):
         """Complete workflow: question -> SQL -> results"""
         try:
             # Generate SQL
             sql = self.generate_sql(question)
             
+            # Optionally answer heavy aggregates from a sample
+            approx_rewrite = self.approximate(sql, sample_percent, tenant) if approx else None
+            exact_sql = self.scope_to_tenant(sql, tenant)
+            sql = exact_sql
+            result = None
+            sampled_rows = None
+            if approx_rewrite:
+                try:
+                    sql = self.scope_to_tenant(approx_rewrite.sql, tenant)
+                    result = self.run_sql(sql, read_only=tenant is not None)
+                    sampled_rows = int(sum(row.get(SAMPLED_ROWS_COLUMN) or 0 for row in result['rows']))
+                except Exception as e:
+                    print(f"⚠️ Approximate query failed, running exact: {e}")
+                    approx_rewrite = None
+                # Too few sampled rows give meaningless estimates (or none at all)
+                if approx_rewrite and sampled_rows < MIN_SAMPLED_ROWS:
+                    print(f"⚠️ Sample held {sampled_rows} rows, running exact")
+                    approx_rewrite = None
+                if approx_rewrite is None:
+                    sql = exact_sql
+                    result = None
+            
             # Execute SQL
-            result = self.run_sql(sql)
+            if result is None:
+                result = self.run_sql(sql, read_only=tenant is not None)
             
             # Generate explanation using Groq
             explanation = self.generate_explanation(question, sql, result)
@@ -236,6 +356,10 @@ Examples of CORRECT syntax:
             return {
                 'question': question,
                 'sql': sql,
+                'sql_id': self.sql_cache.add(exact_sql, tenant.cache_key if tenant else None),
+                'exact_sql': exact_sql,
+                'approx': approx_rewrite,
+                'sampled_rows': sampled_rows,
                 'results': result['rows'],
                 'columns': result['columns'],
                 'row_count': result['row_count'],
@@ -0,0 +1,103 @@
+"""
+Query Workload Recorder
+Logs the fingerprint, timing and EXPLAIN plan of every generated SQL query
+so the offline index advisor can study the real workload
+
+Bound literals (tenant ids, vendor names, ...) are never written: each is
+kept only as a short digest, which is all the advisor needs to tell whether
+a predicate always compares with the same value. The log is rotated to
+"<path>.1" once it passes max_bytes, so at most two files are kept.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from sql_params import parameterize_sql, fingerprint
+
+
+def param_digest(value) -> str:
+    """Short digest standing in for a bound literal in the workload log"""
+    return hashlib.sha1(str(value).encode("utf-8")).hexdigest()[:12]
+
+
+class WorkloadRecorder:
+    def __init__(self, path: str, max_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.explained = set()  # fingerprints whose plan was already captured
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def record(self, cursor, sql: str, duration_ms: float, row_count: int):
+        """Append one execution to the workload log, capturing the plan once per shape"""
+        if not self.enabled:
+            return
+
+        statement, params = parameterize_sql(sql)
+        key = fingerprint(statement)
+
+        plan = None
+        if key not in self.explained:
+            plan = self.explain(cursor, sql)
+            self.explained.add(key)
+
+        entry = {
+            "fingerprint": key,
+            "statement": statement,
+            "param_digests": [param_digest(p) for p in params],
+            "duration_ms": round(duration_ms, 3),
+            "row_count": row_count,
+            "recorded_at": time.time(),
+        }
+        if plan is not None:
+            entry["plan"] = plan
+
+        try:
+            with self.lock:
+                if self.max_bytes and os.path.exists(self.path) and os.path.getsize(self.path) >= self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, default=str) + "\n")
+        except OSError as e:
+            print(f"⚠️ Failed to write workload log: {e}")
+
+    def explain(self, cursor, sql: str):
+        """Return the JSON EXPLAIN plan for SQL without executing it"""
+        if not sql.lstrip().lower().startswith(("select", "with")):
+            return None
+        try:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql.strip().rstrip(';')}")
+            row = cursor.fetchone()
+            plan = list(row.values())[0] if isinstance(row, dict) else row[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            return plan[0]["Plan"]
+        except Exception as e:
+            print(f"⚠️ EXPLAIN failed, recording without plan: {e}")
+            cursor.connection.rollback()
+            return None
+
+
+def load_workload(path: str):
+    """Read a workload log (and its rotated predecessor) into a list of entries,
+    skipping malformed lines"""
+    entries = []
+    for file_path in (path + ".1", path):
+        if not os.path.exists(file_path):
+            continue
+        with open(file_path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return entries